@@ -27,9 +27,9 @@ class FireSimulationApp:
             # Filter the data for the current step
             step_data = data[data['step_count'] == step]
 
-            # Convert locations to latitude and longitude
-            step_data['lat'] = step_data['location'].apply(lambda p: p.y)
-            step_data['lon'] = step_data['location'].apply(lambda p: p.x)
+            # Longitude and latitude of the trees
+            step_data['lat'] = step_data['y']
+            step_data['lon'] = step_data['x']
 
             # Create a PyDeck scatter plot layer
             layer = pdk.Layer(
@@ -1,12 +1,17 @@
 import dash
 import json
 import math
+import os
+import secrets
 import shapely
-from dash import dcc, html, Input, Output, State
+import tempfile
+from dash import dcc, html, Input, Output, State, Patch, no_update
 import plotly.express as px
 import pandas as pd
 import plotly.graph_objects as go
-from src.forest_model import ForestModel
+from src.results_cache import ResultsCache
+from src.scenario_cache import ScenarioCache
+from src.simulation_jobs import SimulationJobs
 from shapely.geometry import Point, Polygon
 from shapely.affinity import scale
 import re
@@ -28,6 +33,15 @@ data['lat'] = data['location'].apply(lambda p: p.y)
 # Initialize the Dash app
 app = dash.Dash(__name__)
 
+# Simulation results stay in the server, the browser only keeps the run id and gets the values of each
+# step as they are played
+results_cache = ResultsCache(max_runs=4)
+
+# Simulations run in background processes, so several users can run them at the same time without
+# blocking the server. Their results are cached on disk by scenario, so a scenario that was already
+# simulated with the same seed loads instead of running again
+simulation_jobs = SimulationJobs(cache=ScenarioCache(os.path.join(tempfile.gettempdir(), "fire_simulation_scenarios")))
+
 # Define the layout of the app
 app.layout = html.Div([
     html.Div([
@@ -60,6 +74,14 @@ app.layout = html.Div([
                             html.H6("Temperature (C)", style={'text-align': 'left', 'margin-top': '5px', 'margin-bottom': '5px', 'color': '#003845'}),
                             dcc.Input("24", id="temperature", style={'font-size': '12px', 'text-align': 'left', 'border': '1px solid #d4d4d4', 'border-radius': '5px', 'padding': '5px'})
                         ], style={'width': '50%', 'display': 'inline-block'})
+                    ], style={'width': '100%', 'margin-bottom': '10px'}),
+
+                    # Row 3
+                    html.Div([
+                        html.Div([
+                            html.H6("Seed (empty for random)", style={'text-align': 'left', 'margin-top': '5px', 'margin-bottom': '5px', 'color': '#003845'}),
+                            dcc.Input("0", id="seed", style={'font-size': '12px', 'text-align': 'left', 'border': '1px solid #d4d4d4', 'border-radius': '5px', 'padding': '5px'})
+                        ], style={'width': '50%', 'display': 'inline-block'})
                     ], style={'width': '100%'})
                 ], style={'display': 'flex', 'flex-wrap': 'wrap'}),
 
@@ -84,7 +106,11 @@ app.layout = html.Div([
                 html.Button('Run Simulation', id='run-button', n_clicks=0,
                             style={"width": "90%", 'margin-top': '12px', 'background-color': '#0077b6',
                                    'color': 'white', 'border': 'none', 'border-radius': '5px', 'padding': '10px',
-                                   'font-family': 'Arial', 'box-shadow': '0 4px 6px rgba(0, 0, 0, 0.1)'})
+                                   'font-family': 'Arial', 'box-shadow': '0 4px 6px rgba(0, 0, 0, 0.1)'}),
+
+                # Progress of the simulation running in the background
+                html.P(id='progress-panel', children="", style={'font-size': '12px', 'color': '#003845'}),
+                dcc.Interval(id='progress-interval', interval=500, n_intervals=0, disabled=True)
 
             ], style={
                 'padding': '20px', 'border-radius': '15px', 'background-color': 'rgba(220, 240, 255, 0.6)',
@@ -152,7 +178,7 @@ app.layout = html.Div([
         ], style={'width': '70%', 'display': 'inline-block', 'padding': '20px', 'background-color': 'white'})
     ], style={'display': 'flex', 'width': '100%'}),
 
-    # Hidden store for intermediate results
+    # Hidden store with the run id and steps of the results in results_cache
     dcc.Store(id='simulation-data'),
     dcc.Store(id='area-data', data={}),
     dcc.Store(id='fire-data', data={}),
@@ -175,20 +201,19 @@ def toggle_interval(n_clicks, disabled):
     Output('time-slider', 'value'),
     Output('map', 'figure', allow_duplicate=True),
     Input('interval-component', 'n_intervals'),
-    State('map', 'figure'),
     State('time-slider', 'value'),
     State('simulation-data', 'data'), prevent_initial_call=True)
-def animate_map(loop_step, fig, current_value, sim_data):
+def animate_map(loop_step, current_value, sim_data):
 
     if not sim_data:
-        return current_value, fig
-
-    sim_data = pd.DataFrame(sim_data)
-    filtered_data = sim_data[sim_data['step_count'] == current_value]
+        return current_value, no_update
 
-    if not filtered_data.empty:
-        fig = go.Figure(fig)
-        fig.data[-1].z = filtered_data["burning_value"]
+    # Only send the new values of the heat map
+    fig = no_update
+    burning_value = results_cache.get_column(sim_data["run_id"], "burning_value", current_value)
+    if burning_value is not None:
+        fig = Patch()
+        fig["data"][0]["z"] = burning_value.tolist()
 
     # Update value
     current_value += 1
@@ -340,15 +365,17 @@ def add_area(n_clicks, relayout_data, text, fig, fire_data, table):
 @app.callback(
     Output('simulation-data', 'data'),
     Output('map', 'figure'),
+    Output('progress-interval', 'disabled'),
     Input('run-button', 'n_clicks'),
     State('temperature', 'value'),
     State('humidity', 'value'),
     State('wind-speed', 'value'),
     State('wind-direction', 'value'),
+    State('seed', 'value'),
     State('area-data', 'data'),
     State('fire-data', 'data'),
     State('map', 'figure'))
-def run_simulation(n_clicks, temperature, humidity, wind_speed, wind_direction, area_data, fire_data, fig):
+def run_simulation(n_clicks, temperature, humidity, wind_speed, wind_direction, seed, area_data, fire_data, fig):
     if n_clicks > 0:
 
         # run simulation here:
@@ -369,23 +396,22 @@ def run_simulation(n_clicks, temperature, humidity, wind_speed, wind_direction,
                          "area": poly}
             fire_areas.append(this_area)
 
-        forest_model = ForestModel(areas=forest_areas,
-                                   wind_conditions={"speed": float(wind_speed), "direction": float(wind_direction)},
-                                   humidity_conditions={"rain": False, "wet": False, "humidity": float(humidity)})
-
-        forest_model.initialise_fire(fire_areas=fire_areas)
-        results = forest_model.run_simulation(simulation_time=10)
-        results["x"] = results["location"].apply(lambda x: x.x)
-        results["y"] = results["location"].apply(lambda x: x.y)
+        parameters = {"areas": forest_areas,
+                      "wind_conditions": {"speed": float(wind_speed), "direction": float(wind_direction)},
+                      "humidity_conditions": {"rain": False, "wet": False, "humidity": float(humidity)},
+                      "temperature": float(temperature)}
 
-        results_plot = results.loc[results["step_count"] == 0, :]
+        # The steps are shown by poll_simulation as the background run records them, or at once if the
+        # scenario is cached. Runs without a seed get a new one, so they are never taken from the cache
+        seed = int(seed) if seed else secrets.randbits(64)
+        run_id = simulation_jobs.submit(parameters=parameters, fire_areas=fire_areas, simulation_time=10, seed=seed)
 
         fig = go.Figure(fig)
         fig.data = []
         fig.add_trace(go.Densitymapbox(
-            lat=results_plot['y'],
-            lon=results_plot['x'],
-            z=results_plot['burning_value'],
+            lat=[],
+            lon=[],
+            z=[],
             zmin=0,
             zmax=1,
             radius=30,
@@ -393,10 +419,56 @@ def run_simulation(n_clicks, temperature, humidity, wind_speed, wind_direction,
             colorscale=custom_color_scale
         ))
 
-        results = results.loc[:, ["x", "y", "burning_value", "color", "step_count"]].to_dict()
-        return results, fig
+        return {"run_id": run_id, "step_counts": []}, fig, False
+
+    return {}, fig, True
 
-    return {}, fig
+
+@app.callback(
+    Output('simulation-data', 'data', allow_duplicate=True),
+    Output('map', 'figure', allow_duplicate=True),
+    Output('progress-panel', 'children'),
+    Output('progress-interval', 'disabled', allow_duplicate=True),
+    Input('progress-interval', 'n_intervals'),
+    State('simulation-data', 'data'), prevent_initial_call=True)
+def poll_simulation(n_intervals, sim_data):
+
+    if not sim_data:
+        return no_update, no_update, no_update, True
+
+    run_id = sim_data["run_id"]
+    status = simulation_jobs.status(run_id)
+
+    # The reader of a run is cached once it starts writing, and follows the run as it records steps
+    results = results_cache.get(run_id)
+    if results is None:
+        results = simulation_jobs.reader(run_id)
+        if results is not None:
+            results_cache.put(run_id, results)
+    if results is not None:
+        results.refresh()
+    step_counts = [] if results is None else results.step_counts.tolist()
+
+    if status["state"] == "running":
+        progress = f"Simulating: {len(step_counts)} of {status['n_steps']} steps"
+    elif status["state"] == "done":
+        progress = f"Simulation finished: {len(step_counts)} steps"
+    elif status["state"] == "failed":
+        progress = f"Simulation failed: {status['error']}"
+    else:
+        progress = "Simulation not found"
+
+    if len(step_counts) == len(sim_data["step_counts"]):
+        return no_update, no_update, progress, status["state"] != "running"
+
+    # Show the last recorded step
+    fig = Patch()
+    if not sim_data["step_counts"]:
+        fig["data"][0]["lat"] = results.y.tolist()
+        fig["data"][0]["lon"] = results.x.tolist()
+    fig["data"][0]["z"] = results.get_column("burning_value", step_counts[-1]).tolist()
+
+    return {"run_id": run_id, "step_counts": step_counts}, fig, progress, status["state"] != "running"
 
 
 def get_bounds(center_lat, center_lon, zoom_level, tile_size=256):
@@ -0,0 +1,269 @@
+import argparse
+import contextlib
+import gc
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+import mesa
+import numpy as np
+import pandas as pd
+import shapely
+from shapely.geometry import Polygon
+from src.forest_model import ForestModel
+from src.results_recorder import ResultsRecorder
+
+# Synthetic forest: agents per scale are area * TREE_DENSITY / TREES_PER_AGENT
+CENTER = (-1.64323, 42.81852)
+TREE_DENSITY = 0.1
+TREES_PER_AGENT = 100
+FIRE_FRACTION = 0.005
+WIND_CONDITIONS = {"speed": 30, "direction": 45}
+HUMIDITY_CONDITIONS = {"rain": False, "wet": False, "humidity": 50}
+
+# The agent engine steps every tree in Python, larger scales are skipped unless asked for
+AGENT_ENGINE_MAX_SCALE = 100_000
+
+# Stages in the order they run
+STAGES = ("construction", "initialise_fire", "step", "record", "assembly", "export")
+
+
+def synthetic_polygon(area_m2, rng, n_vertices=24, roughness=0.25):
+    """
+    Irregular star-shaped polygon around CENTER with a given area.
+
+    :param area_m2: Area of the polygon in square meters.
+    :param rng: NumPy random Generator the shape is drawn from.
+    :param n_vertices: Number of vertices.
+    :param roughness: Relative variation of the distance of the vertices to the centre.
+    :return: Shapely Polygon in lon/lat.
+    """
+    angles = np.sort(rng.uniform(0, 2 * np.pi, n_vertices))
+    radii = 1 + roughness * rng.uniform(-1, 1, n_vertices)
+    x, y = radii * np.cos(angles), radii * np.sin(angles)
+
+    # Scale the unit shape to the area in meters, then to degrees around the centre
+    scale = np.sqrt(area_m2 / Polygon(np.column_stack([x, y])).area)
+    metres_per_degree_lat = 110540
+    metres_per_degree_lon = 111320 * np.cos(np.radians(CENTER[1]))
+
+    return Polygon(np.column_stack([CENTER[0] + x * scale / metres_per_degree_lon,
+                                    CENTER[1] + y * scale / metres_per_degree_lat]))
+
+
+def synthetic_scenario(scale, seed):
+    """
+    Seeded forest and fire areas with about `scale` agents.
+
+    :param scale: Number of agents.
+    :param seed: Seed of the shapes.
+    :return: Tuple with the forest areas and the fire areas.
+    """
+    rng = np.random.default_rng([seed, scale])
+    forest_area = scale * TREES_PER_AGENT / TREE_DENSITY
+    areas = [{"name": "Area1",
+              "area": synthetic_polygon(forest_area, rng),
+              "vegetation": [{"tree": "pine", "tree_density_m": TREE_DENSITY}]}]
+    fire_areas = [{"name": "Fire1", "area": synthetic_polygon(forest_area * FIRE_FRACTION, rng)}]
+
+    return areas, fire_areas
+
+
+class StageTimer:
+
+    def __init__(self, trace_memory=False):
+        """
+        Accumulates the time of every stage, and its peak memory over the memory at its start when
+        `trace_memory` is set (tracemalloc slows the code down, so times and memory are measured in
+        different runs).
+
+        :param trace_memory: Measure the peak memory of the stages with tracemalloc.
+        """
+        self.trace_memory = trace_memory
+        self.times = {}
+        self.peaks = {}
+        self.step_times = []
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+            start_memory = tracemalloc.get_traced_memory()[0]
+
+        start = time.perf_counter()
+        yield
+        elapsed = time.perf_counter() - start
+
+        self.times[name] = self.times.get(name, 0.0) + elapsed
+        if name == "step":
+            self.step_times.append(elapsed)
+        if self.trace_memory:
+            peak = tracemalloc.get_traced_memory()[1] - start_memory
+            self.peaks[name] = max(self.peaks.get(name, 0), peak)
+
+
+def run_stages(engine, scale, steps, seed, timer):
+    """
+    Run every stage of one engine at one scale.
+
+    :param engine: Engine in ForestModel.ENGINES.
+    :param scale: Number of agents.
+    :param steps: Number of simulated steps.
+    :param seed: Seed of the scenario and of the model.
+    :param timer: StageTimer.
+    :return: Number of agents (cells for the raster engine) of the model.
+    """
+    areas, fire_areas = synthetic_scenario(scale, seed)
+
+    with timer.stage("construction"):
+        model = ForestModel(areas=areas, wind_conditions=WIND_CONDITIONS, humidity_conditions=HUMIDITY_CONDITIONS,
+                            trees_per_agent=TREES_PER_AGENT, engine=engine, seed=seed)
+
+    with timer.stage("initialise_fire"):
+        model.initialise_fire(fire_areas)
+
+    # Same loop as run_simulation, with the steps and the recording timed apart. The first state is the
+    # one before the first step
+    recorder = ResultsRecorder(lon=model.lon, lat=model.lat, n_steps=steps + 1)
+    states = model.iter_states(simulation_time=steps)
+    with timer.stage("record"):
+        recorder.record(*next(states))
+
+    while True:
+        with timer.stage("step"):
+            item = next(states, None)
+        if item is None:
+            # The last call only finds out that the simulation is over
+            timer.times["step"] -= timer.step_times.pop()
+            break
+
+        with timer.stage("record"):
+            recorder.record(*item)
+
+    with timer.stage("assembly"):
+        results = recorder.to_frame()
+
+    with tempfile.TemporaryDirectory() as directory, timer.stage("export"):
+        results.to_csv(os.path.join(directory, "results.csv"), index=False)
+
+    return len(model.lon)
+
+
+def benchmark(engine, scale, steps, seed, trace_memory=True):
+    """
+    Time every stage of one engine at one scale, and measure their peak memory in a second run.
+
+    :return: Dictionary with the engine, scale, number of agents, steps and stages.
+    """
+    gc.collect()
+    timer = StageTimer()
+    n_agents = run_stages(engine, scale, steps, seed, timer)
+
+    peaks = {}
+    if trace_memory:
+        gc.collect()
+        tracemalloc.start()
+        memory_timer = StageTimer(trace_memory=True)
+        run_stages(engine, scale, steps, seed, memory_timer)
+        tracemalloc.stop()
+        peaks = memory_timer.peaks
+
+    return {"engine": engine,
+            "scale": scale,
+            "n_agents": n_agents,
+            "steps": len(timer.step_times),
+            "stages": {name: {"time_s": timer.times.get(name, 0.0), "peak_bytes": peaks.get(name)}
+                       for name in STAGES},
+            "step_times_s": timer.step_times}
+
+
+def environment():
+    """
+    Versions and commit the benchmark ran on, to tell results apart.
+    """
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+
+    return {"commit": commit,
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "numpy": np.__version__,
+            "pandas": pd.__version__,
+            "shapely": shapely.__version__,
+            "mesa": mesa.__version__}
+
+
+def compare(previous, current):
+    """
+    Print the relative change of the time and peak memory of every stage between two benchmark files.
+
+    :param previous: Results of the reference run (loaded JSON).
+    :param current: Results of the new run (loaded JSON).
+    """
+    reference = {(result["engine"], result["scale"]): result for result in previous["results"]}
+    print(f"{'engine':<12}{'scale':>10}  {'stage':<16}{'time':>10}{'change':>9}{'peak MB':>10}{'change':>9}")
+    for result in current["results"]:
+        old = reference.get((result["engine"], result["scale"]))
+        if old is None or "stages" not in result or "stages" not in old:
+            continue
+
+        for name in STAGES:
+            new_stage, old_stage = result["stages"][name], old["stages"][name]
+            time_change = new_stage["time_s"] / old_stage["time_s"] - 1 if old_stage["time_s"] else float("nan")
+            peak = new_stage["peak_bytes"]
+            peak_change = (peak / old_stage["peak_bytes"] - 1
+                           if peak is not None and old_stage["peak_bytes"] else float("nan"))
+            print(f"{result['engine']:<12}{result['scale']:>10}  {name:<16}{new_stage['time_s']:>9.3f}s"
+                  f"{time_change:>+9.1%}{(peak or 0) / 1e6:>10.1f}{peak_change:>+9.1%}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the construction, stepping and result export of "
+                                                 "ForestModel on seeded synthetic forests. Run from Fire_Simulator "
+                                                 "with: python -m benchmarks.run_benchmarks")
+    parser.add_argument("--scales", type=int, nargs="+", default=[1_000, 10_000, 100_000, 1_000_000],
+                        help="Number of agents of every benchmarked forest.")
+    parser.add_argument("--engines", nargs="+", default=list(ForestModel.ENGINES), choices=ForestModel.ENGINES)
+    parser.add_argument("--steps", type=int, default=5, help="Number of simulated steps.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--agent-max-scale", type=int, default=AGENT_ENGINE_MAX_SCALE,
+                        help="Largest scale run with the agent engine.")
+    parser.add_argument("--no-memory", action="store_true", help="Skip the tracemalloc run of every benchmark.")
+    parser.add_argument("--output", default="benchmark_results.json", help="JSON file with the results.")
+    parser.add_argument("--compare", help="Previous JSON results to compare with.")
+    args = parser.parse_args(argv)
+
+    results = []
+    for scale in args.scales:
+        for engine in args.engines:
+            if engine == "agent" and scale > args.agent_max_scale:
+                results.append({"engine": engine, "scale": scale, "skipped": "larger than --agent-max-scale"})
+                continue
+
+            result = benchmark(engine, scale, args.steps, args.seed, trace_memory=not args.no_memory)
+            results.append(result)
+            print(f"{engine:<12}{scale:>10} agents  " +
+                  "  ".join(f"{name} {stage['time_s']:.3f}s" for name, stage in result["stages"].items()),
+                  file=sys.stderr)
+
+    output = {"environment": environment(), "arguments": vars(args), "results": results}
+    with open(args.output, "w") as file:
+        json.dump(output, file, indent=2)
+
+    if args.compare:
+        with open(args.compare) as file:
+            compare(json.load(file), output)
+
+
+if __name__ == "__main__":
+    main()
@@ -42,8 +42,7 @@ if __name__ == "__main__":
     plt.plot(x, y, color="blue")
 
     # Plot the centroids
-    for centroid in results.location:
-        plt.plot(centroid.x, centroid.y, "ro")
+    plt.plot(results.x, results.y, "ro")
 
     plt.gca().set_aspect('equal', adjustable='box')
     plt.savefig("square_centroids.png")
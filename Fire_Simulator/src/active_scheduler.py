@@ -0,0 +1,150 @@
+import numpy as np
+import shapely
+from mesa.time import BaseScheduler
+from src.spatial_index import radius_in_degrees
+
+
+class TreeActivation(BaseScheduler):
+    """
+    Random activation of the trees of a model by their position in the model order, the same
+    activation as a RandomActivation of their Tree agents without a Mesa agent per tree: the order is
+    an array of positions, reshuffled every step from the previous one, and the Tree views are created
+    when they are stepped.
+    """
+
+    def __init__(self, model, n_trees=0):
+        super().__init__(model)
+        self.order = np.arange(n_trees, dtype=np.int64)
+
+    @property
+    def order(self):
+        return self._order
+
+    @order.setter
+    def order(self, order):
+        self._order = order
+        self._rank = None
+
+    @property
+    def rank(self):
+        """
+        :return: Array with the place of every tree in the schedule order, by position.
+        """
+        if self._rank is None:
+            self._rank = np.empty(len(self._order), dtype=np.int64)
+            self._rank[self._order] = np.arange(len(self._order))
+
+        return self._rank
+
+    def sort(self, positions):
+        """
+        :param positions: Array of tree positions.
+        :return: The positions in schedule order.
+        """
+        return positions[np.argsort(self.rank[positions], kind="stable")]
+
+    @property
+    def agents(self):
+        """
+        :return: List of the Tree agents, in schedule order.
+        """
+        tree_agents = self.model.tree_agents
+        return [tree_agents[ii] for ii in self.order]
+
+    def get_agent_count(self):
+        return len(self.order)
+
+    def step(self):
+
+        # Shuffle a list, the same permutation `random.shuffle` draws for a list of agents
+        order = self.order.tolist()
+        self.model.random.shuffle(order)
+        self.order = np.array(order, dtype=np.int64)
+
+        tree_agents = self.model.tree_agents
+        for ii in order:
+            tree_agents[ii].step()
+
+        self.steps += 1
+        self.time += 1
+
+
+class ActiveFrontActivation(TreeActivation):
+    """
+    Random activation restricted to the agents that can change state: trees on fire, trees that burned
+    out in the previous step and unburned trees within the influence radius of a tree on fire. The cost
+    of a step scales with the fire front instead of with the forest, and the model stops running once
+    no agent is active.
+
+    Inactive trees do not draw random numbers, so runs are statistically equivalent to, but not the
+    same sequence as, a TreeActivation run with the same seed.
+    """
+
+    def __init__(self, model, n_trees=0):
+        super().__init__(model, n_trees)
+        self.burning = None
+
+    def reset(self):
+        """
+        Forget the cached fire front, needed after changing the state of the agents outside a step.
+        """
+        self.burning = None
+
+    def set_front(self, positions):
+        """
+        Set the cached fire front, in the order a previous run left it, to resume that run exactly.
+
+        :param positions: Positions of the trees that were burning at the end of the previous step.
+        """
+        self.burning = [int(ii) for ii in positions]
+
+    def is_burning(self, positions):
+        """
+        :param positions: Array of tree positions.
+        :return: Boolean array, whether the trees are on fire or still smouldering after burning out.
+        """
+        columns = self.model.tree_columns
+        return columns.on_fire[positions] | (columns.is_burned[positions] & (columns.burning_value[positions] != 1))
+
+    def get_active_agents(self):
+        """
+        :return: List with the positions of the active trees: the fire front, then the unburned trees
+            around it in the model order.
+        """
+        columns = self.model.tree_columns
+
+        # Only trees stepped in the previous step can have changed, otherwise scan them all
+        if self.burning is None:
+            self.burning = self.order[self.is_burning(self.order)].tolist()
+
+        active = list(self.burning)
+        burning = np.array(self.burning, dtype=np.int64)
+        sources = burning[columns.on_fire[burning]]
+        if len(sources):
+            lon, lat = self.model.lon[sources], self.model.lat[sources]
+            radius = radius_in_degrees(self.model.influence_radius, np.abs(lat).max())
+            _, neighbours = self.model.get_location_index().query(shapely.points(lon, lat), predicate="dwithin",
+                                                                  distance=radius)
+
+            # Positions in the location index are positions in the model order
+            neighbours = np.unique(neighbours)
+            active += neighbours[~(columns.on_fire[neighbours] | columns.is_burned[neighbours])].tolist()
+
+        return active
+
+    def step(self):
+
+        active = self.get_active_agents()
+        self.model.instrumentation.count("active", len(active))
+        if not active:
+            self.model.running = False
+
+        self.model.random.shuffle(active)
+        tree_agents = self.model.tree_agents
+        for ii in active:
+            tree_agents[ii].step()
+
+        active = np.array(active, dtype=np.int64)
+        self.burning = active[self.is_burning(active)].tolist()
+        self.steps += 1
+        self.time += 1
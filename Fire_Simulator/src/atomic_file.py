@@ -0,0 +1,23 @@
+import os
+from contextlib import contextmanager
+
+
+@contextmanager
+def atomic_path(path):
+    """
+    Temporary path to write a file to, moved to `path` at once when the block ends, so that other
+    processes or readers of a run in progress never see a partial file. The temporary file is removed
+    if the block raises.
+
+    :param path: Final path of the file.
+    :return: Temporary path in the same directory, with the extension of `path`.
+    """
+    root, extension = os.path.splitext(path)
+    temporary = f"{root}.{os.getpid()}.tmp{extension}"
+    try:
+        yield temporary
+        os.replace(temporary, path)
+    except BaseException:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+        raise
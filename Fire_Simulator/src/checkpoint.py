@@ -0,0 +1,68 @@
+import pickle
+import numpy as np
+from src.atomic_file import atomic_path
+from src.vectorized_engine import STATE_KEYS
+
+
+def _pickled(value):
+    return np.frombuffer(pickle.dumps(value), dtype=np.uint8)
+
+
+def save_checkpoint(model, path):
+    """
+    Save the state of a model in a compact npz file: the state arrays of the trees, the agent
+    locations, the random generator states, the order of the agents in the scheduler, the step
+    counter and the constructor parameters.
+
+    The weather schedule is stateless (the weather of a step only depends on the step counter), so
+    the step counter is its cursor. The file is written to a temporary file first and renamed, so a
+    crash while saving never leaves a partial checkpoint.
+
+    :param model: ForestModel.
+    :param path: Path of the npz file.
+    """
+    layout = model.get_layout()
+    arrays = {f"state_{key}": np.asarray(values) for key, values in model.get_state().items()}
+    arrays.update({"layout": np.concatenate(layout) if layout else np.empty((0, 2)),
+                   "layout_sizes": np.array([len(locations) for locations in layout], dtype=np.int64),
+                   "step_count": np.int64(model.step_count),
+                   "running": np.bool_(model.running),
+                   "parameters": _pickled(model.parameters),
+                   "fires": _pickled(model.fires),
+                   "random_state": _pickled(model.random.getstate()),
+                   "rng_state": _pickled(model.rng.bit_generator.state),
+                   "engine_seed": np.uint64(model.vectorized_engine.seed if model.vectorized_engine else 0)})
+
+    # The agent schedulers keep the order they shuffled the agents in, which the next shuffle starts from
+    schedule_order, front_order = model.get_schedule_order()
+    arrays.update({"schedule_order": schedule_order,
+                   "front_order": np.empty(0, dtype=np.int64) if front_order is None else front_order,
+                   "has_front": np.bool_(front_order is not None)})
+
+    # Written to an open file, since np.savez adds .npz to file names without it
+    with atomic_path(path) as temporary, open(temporary, "wb") as file:
+        np.savez(file, **arrays)
+
+
+def load_checkpoint(path):
+    """
+    Read a checkpoint written by `save_checkpoint`.
+
+    :param path: Path of the npz file.
+    :return: Dictionary with state, layout, step_count, running, parameters, fires, random_state,
+        rng_state, engine_seed, schedule_order and front_order.
+    """
+    with np.load(path) as data:
+        sizes = data["layout_sizes"]
+        layout = np.split(data["layout"], np.cumsum(sizes)[:-1]) if len(sizes) else []
+        return {"state": {key: data[f"state_{key}"] for key in STATE_KEYS},
+                "layout": layout,
+                "step_count": int(data["step_count"]),
+                "running": bool(data["running"]),
+                "parameters": pickle.loads(data["parameters"].tobytes()),
+                "fires": pickle.loads(data["fires"].tobytes()),
+                "random_state": pickle.loads(data["random_state"].tobytes()),
+                "rng_state": pickle.loads(data["rng_state"].tobytes()),
+                "engine_seed": int(data["engine_seed"]),
+                "schedule_order": data["schedule_order"],
+                "front_order": data["front_order"] if data["has_front"] else None}
@@ -0,0 +1,74 @@
+import numpy as np
+import pyproj
+
+# WGS84 ellipsoid
+GEOD = pyproj.Geod(ellps="WGS84")
+SEMI_MAJOR_AXIS = 6378137.0
+ECCENTRICITY_SQUARED = 6.69437999014e-3
+
+
+# Every kernel returns the direction from 1 to 2 on the ground, in degrees counterclockwise from east
+# (0 east, 90 north), the convention of the wind direction
+
+
+def geodesic(lon1, lat1, lon2, lat2):
+    """
+    Ellipsoidal (WGS84) distance, as computed by geopy, and the direction of the geodesic at 1.
+
+    :return: Tuple with the arrays of distances in meters and directions in degrees from 1 to 2.
+    """
+    lon1, lat1, lon2, lat2 = np.broadcast_arrays(*[np.asarray(v, dtype=float) for v in (lon1, lat1, lon2, lat2)])
+    azimuth, _, distance = GEOD.inv(lon1, lat1, lon2, lat2)
+
+    # Azimuths are clockwise from north
+    angle = np.mod(90 - np.asarray(azimuth) + 180, 360) - 180
+
+    return np.asarray(distance), angle
+
+
+def haversine(lon1, lat1, lon2, lat2):
+    """
+    Great-circle distance on the sphere that osculates the ellipsoid at the mid latitude and along the
+    direction of each pair, and the direction in meters east/north.
+
+    :return: Tuple with the arrays of distances in meters and directions in degrees from 1 to 2.
+    """
+    lon1, lat1, lon2, lat2 = [np.radians(np.asarray(v, dtype=float)) for v in (lon1, lat1, lon2, lat2)]
+    dlon = lon2 - lon1
+    dlat = lat2 - lat1
+    mid_lat = (lat1 + lat2) / 2
+
+    # Meridian and prime vertical radii of curvature at the mid latitude
+    w = 1 - ECCENTRICITY_SQUARED * np.sin(mid_lat) ** 2
+    meridian_radius = SEMI_MAJOR_AXIS * (1 - ECCENTRICITY_SQUARED) / w ** 1.5
+    vertical_radius = SEMI_MAJOR_AXIS / np.sqrt(w)
+
+    # Direction in meters east/north and Euler's radius of curvature along it
+    east = dlon * np.cos(mid_lat) * vertical_radius
+    north = dlat * meridian_radius
+    angle = np.arctan2(north, east)
+    radius = 1 / (np.sin(angle) ** 2 / meridian_radius + np.cos(angle) ** 2 / vertical_radius)
+
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlon / 2) ** 2
+    distance = 2 * radius * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+    return distance, np.degrees(angle)
+
+
+def planar(x1, y1, x2, y2):
+    """
+    Euclidean distance and direction between projected coordinates in meters.
+
+    :return: Tuple with the arrays of distances in meters and directions in degrees from 1 to 2.
+    """
+    dx = np.asarray(x2, dtype=float) - x1
+    dy = np.asarray(y2, dtype=float) - y1
+
+    return np.hypot(dx, dy), np.degrees(np.arctan2(dy, dx))
+
+
+DISTANCE_KERNELS = {"geodesic": geodesic, "haversine": haversine, "planar": planar}
+
+# Kernels that work on the projected (x, y) coordinates instead of (lon, lat)
+PROJECTED_KERNELS = ("planar",)
+
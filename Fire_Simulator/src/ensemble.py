@@ -0,0 +1,147 @@
+import numpy as np
+import pandas as pd
+from multiprocessing import Pool
+
+# Configuration shared by all the realisations, sent once to every worker process
+_config = None
+
+
+def _init_worker(config):
+    global _config
+    _config = config
+
+
+def run_realisation(seed):
+    """
+    Run one realisation of the ensemble configured in the worker and summarise it.
+
+    :param seed: Seed of the realisation.
+    :return: Tuple with the seed, the mask of the trees that burned and the number of trees burning
+        and burned at every step.
+    """
+    # Mesa seeds its random.Random with the seed, which does not accept NumPy integers
+    model = _config["model_class"](seed=int(seed), layout=_config["layout"], **_config["parameters"])
+    model.initialise_fire(_config["fire_areas"])
+
+    if _config["neighbour_graph"] is not None:
+        model.vectorized_engine.neighbour_graph = _config["neighbour_graph"]
+
+    n_steps = _config["simulation_time"] + 1
+    burning = np.zeros(n_steps, dtype=np.int64)
+    burned = np.zeros(n_steps, dtype=np.int64)
+
+    for t, (step_count, state) in enumerate(model.iter_states(_config["simulation_time"],
+                                                              adaptive=_config["adaptive"])):
+        burning[t], burned[t] = state["on_fire"].sum(), state["is_burned"].sum()
+
+    # The model stopped early because nothing changes anymore, keep the last counts
+    burning[t + 1:], burned[t + 1:] = burning[t], burned[t]
+
+    # Trees still on fire at the end will burn
+    return seed, state["is_burned"] | state["on_fire"], burning, burned
+
+
+class EnsembleResult:
+
+    def __init__(self, lon, lat, seeds, burn_counts, burning, burned):
+        """
+        Aggregated results of an ensemble of realisations.
+
+        :param lon: Longitude of every tree.
+        :param lat: Latitude of every tree.
+        :param seeds: Seeds (integers) of the realisations, in the order they finished.
+        :param burn_counts: Number of realisations in which every tree burned.
+        :param burning: Array (realisations x steps) with the number of trees on fire.
+        :param burned: Array (realisations x steps) with the number of burned trees.
+        """
+        self.lon = lon
+        self.lat = lat
+        self.seeds = [int(seed) for seed in seeds]
+        self.burn_counts = burn_counts
+        self.burning = burning
+        self.burned = burned
+
+    @property
+    def n_runs(self):
+        return len(self.seeds)
+
+    @property
+    def burn_probability(self):
+        return self.burn_counts / max(self.n_runs, 1)
+
+    def to_frame(self):
+        """
+        Burn probability map.
+
+        :return: DataFrame with agent_id, x (lon), y (lat) and burn_probability columns.
+        """
+        return pd.DataFrame({"agent_id": np.arange(len(self.lon)),
+                             "x": self.lon,
+                             "y": self.lat,
+                             "burn_probability": self.burn_probability})
+
+    def percentiles(self, q=(5, 50, 95)):
+        """
+        Percentiles across the realisations of the number of trees on fire and burned at every step.
+
+        :param q: Percentiles to compute.
+        :return: DataFrame with step_count and burning_p<q>, burned_p<q> columns.
+        """
+        statistics = {"step_count": np.arange(self.burned.shape[1])}
+        for name, counts in (("burning", self.burning), ("burned", self.burned)):
+            for value, percentile in zip(q, np.percentile(counts, q, axis=0)):
+                statistics[f"{name}_p{value}"] = percentile
+
+        return pd.DataFrame(statistics)
+
+
+def run_ensemble(model, n_runs, simulation_time=100, seeds=None, processes=None, adaptive=False):
+    """
+    Run `n_runs` seeded realisations of `model`, reusing its geometry, agent placement and fires, and
+    aggregate them as they finish so that no realisation keeps its full results.
+
+    :param model: ForestModel with the fires initialised, used as the template of every realisation.
+    :param n_runs: Number of realisations.
+    :param simulation_time: Number of steps of every realisation.
+    :param seeds: Optional list with the seed of every realisation.
+    :param processes: Number of worker processes (None uses all the CPUs, 1 runs in this process).
+    :param adaptive: Stop the realisations once the fire is out and fast-forward their quiescent steps.
+    :return: EnsembleResult.
+    """
+    if seeds is None:
+        seeds = model.rng.integers(2 ** 32, size=n_runs)
+    seeds = [int(seed) for seed in seeds]
+
+    # Build the neighbour graph of the forest once, in the template, for every realisation
+    if model.neighbour_graph:
+        model.vectorized_engine.neighbour_graph = model.get_neighbour_graph()
+
+    config = {"model_class": type(model),
+              "parameters": model.parameters,
+              "layout": model.get_layout(),
+              "fire_areas": model.fires,
+              "neighbour_graph": model.vectorized_engine.neighbour_graph if model.neighbour_graph else None,
+              "simulation_time": simulation_time,
+              "adaptive": adaptive}
+
+    n_agents = len(model.lon)
+    burn_counts = np.zeros(n_agents, dtype=np.int64)
+    burning = np.zeros((len(seeds), simulation_time + 1), dtype=np.int64)
+    burned = np.zeros((len(seeds), simulation_time + 1), dtype=np.int64)
+    finished = []
+
+    def aggregate(realisations):
+        for ii, (seed, affected, run_burning, run_burned) in enumerate(realisations):
+            finished.append(seed)
+            burn_counts[:] += affected
+            burning[ii], burned[ii] = run_burning, run_burned
+
+    if processes == 1:
+        _init_worker(config)
+        aggregate(map(run_realisation, seeds))
+    else:
+        with Pool(processes=processes, initializer=_init_worker, initargs=(config,)) as pool:
+            aggregate(pool.imap_unordered(run_realisation, seeds))
+
+    return EnsembleResult(lon=model.lon, lat=model.lat, seeds=finished, burn_counts=burn_counts,
+                          burning=burning, burned=burned)
@@ -0,0 +1,118 @@
+import logging
+import numpy as np
+import pandas as pd
+
+# Events of the trees, stored as codes
+EVENTS = np.array(["ignited", "burning", "burned_out"])
+IGNITED, BURNING, BURNED_OUT = range(len(EVENTS))
+
+# Events recorded at every verbosity level: "transitions" only records the changes of state,
+# "verbose" also every step a tree keeps burning
+LEVELS = {"silent": (),
+          "transitions": (IGNITED, BURNED_OUT),
+          "verbose": (IGNITED, BURNING, BURNED_OUT)}
+
+
+class EventLog:
+
+    def __init__(self, level="transitions", logger=None, capacity=1024):
+        """
+        Buffered in-memory sink of the events of the trees: one (step_count, agent_id, event) record
+        per event, in growing typed arrays, to analyse a run without parsing text logs.
+
+        :param level: Verbosity in LEVELS. "silent" records nothing and costs next to nothing.
+        :param logger: Optional logging.Logger that also gets every recorded event at DEBUG level.
+        :param capacity: Initial number of records of the buffers.
+        """
+        if level not in LEVELS:
+            raise ValueError(f"Unknown event level '{level}', expected one of {tuple(LEVELS)}")
+
+        self.level = level
+        self.recorded = frozenset(LEVELS[level])
+        self.logger = logger
+        self.n_events = 0
+        self.step_count = np.empty(capacity, dtype=np.int32)
+        self.agent_id = np.empty(capacity, dtype=np.int64)
+        self.event = np.empty(capacity, dtype=np.int8)
+
+    def __len__(self):
+        return self.n_events
+
+    def records(self, event):
+        """
+        :param event: Event code.
+        :return: Whether the level records the event.
+        """
+        return event in self.recorded
+
+    def reserve(self, n):
+
+        # Double the buffers until n more records fit
+        size = len(self.event)
+        if self.n_events + n <= size:
+            return
+
+        size = max(size, 1)
+        while self.n_events + n > size:
+            size *= 2
+        for name in ("step_count", "agent_id", "event"):
+            values = np.empty(size, dtype=getattr(self, name).dtype)
+            values[:self.n_events] = getattr(self, name)[:self.n_events]
+            setattr(self, name, values)
+
+    def record(self, step_count, agent_id, event):
+        """
+        Record the event of one tree, if the level records it.
+
+        :param step_count: Step of the event.
+        :param agent_id: Id of the tree.
+        :param event: Event code (IGNITED, BURNING or BURNED_OUT).
+        """
+        if event not in self.recorded:
+            return
+
+        self.reserve(1)
+        self.step_count[self.n_events] = step_count
+        self.agent_id[self.n_events] = agent_id
+        self.event[self.n_events] = event
+        self.n_events += 1
+
+        if self.logger is not None:
+            self.logger.debug("%s %s at step %s", agent_id, EVENTS[event], step_count)
+
+    def record_many(self, step_count, agent_ids, event):
+        """
+        Record the same event of many trees, if the level records it.
+
+        :param step_count: Step of the events.
+        :param agent_ids: Array with the ids of the trees.
+        :param event: Event code (IGNITED, BURNING or BURNED_OUT).
+        """
+        if event not in self.recorded:
+            return
+
+        n = len(agent_ids)
+        self.reserve(n)
+        rows = slice(self.n_events, self.n_events + n)
+        self.step_count[rows] = step_count
+        self.agent_id[rows] = agent_ids
+        self.event[rows] = event
+        self.n_events += n
+
+        if self.logger is not None and self.logger.isEnabledFor(logging.DEBUG):
+            for agent_id in agent_ids:
+                self.logger.debug("%s %s at step %s", agent_id, EVENTS[event], step_count)
+
+    def clear(self):
+        self.n_events = 0
+
+    def to_frame(self):
+        """
+        Recorded events, in the order they happened within every step.
+
+        :return: DataFrame with step_count, agent_id and event (categorical) columns.
+        """
+        rows = slice(0, self.n_events)
+        return pd.DataFrame({"step_count": self.step_count[rows].copy(),
+                             "agent_id": self.agent_id[rows].copy(),
+                             "event": pd.Categorical.from_codes(self.event[rows], categories=EVENTS)})
@@ -1,48 +1,46 @@
 import shapely
-from src.tree_model import Tree
+from src.projection import area_in_square_meters
 from shapely.geometry import Polygon, LineString, Point
-from shapely.ops import transform
-import uuid
 import math
-import random
-import pyproj
+import numpy as np
 
 
 class ForestArea:
 
-    def __init__(self, area, trees_per_agent, model):
+    def __init__(self, area, trees_per_agent, model, locations=None):
+        """
+        Forest area with the locations (lon/lat float arrays) of the agents that represent its trees.
+
+        :param area: Dictionary with the "name", "area" (Shapely Polygon in lon/lat) and "vegetation".
+        :param trees_per_agent: Number of trees each agent represents.
+        :param model: ForestModel the agents belong to.
+        :param locations: Optional (n, 2) array of agent lon/lat to reuse instead of sampling new ones.
+        """
 
         self.area_properties = area
         self.number_of_trees = 0
         self.trees_properties = list()
         self.area = area["area"]
-        for tree_group in area["vegetation"]:
 
-            # Define a projection to convert lat/lon to meters (e.g., UTM zone 14N)
-            project = pyproj.Transformer.from_crs("EPSG:4326", "EPSG:32614", always_xy=True).transform
-
-            # Reproject the polygon to a coordinate system that uses meters
-            projected_polygon = transform(project, area["area"])
-
-            # Calculate the area in square meters
-            area_in_square_meters = projected_polygon.area
-            self.number_of_trees += area_in_square_meters * tree_group["tree_density_m"]
+        # Project the polygon once into the UTM zone of its centroid to get its area in square meters
+        self.area_in_square_meters = area_in_square_meters(self.area)
+        for tree_group in area["vegetation"]:
+            self.number_of_trees += self.area_in_square_meters * tree_group["tree_density_m"]
             self.trees_properties.append(tree_group)
 
-        area_centroids = self.set_random_agent_location(polygon=area["area"],
-                                                        n=math.ceil(self.number_of_trees / trees_per_agent))
+        # The raster engine works on a grid of the areas instead of agent locations
+        if model.engine == "raster":
+            self.lon, self.lat = np.empty(0), np.empty(0)
+        elif locations is None:
+            self.lon, self.lat = self.set_random_agent_location(polygon=area["area"],
+                                                                n=math.ceil(self.number_of_trees / trees_per_agent),
+                                                                rng=model.placement_rng)
+        else:
+            locations = np.asarray(locations, dtype=float).reshape(-1, 2)
+            self.lon, self.lat = locations[:, 0].copy(), locations[:, 1].copy()
 
-        self.tree_agents = list()
-        for ii, centroid in enumerate(area_centroids):
-
-            # Create Tree agent
-            this_three = Tree(unique_id=int(uuid.uuid4()),
-                              trees_properties=self.trees_properties,
-                              location=centroid,
-                              model=model)
-
-            model.schedule.add(this_three)
-            self.tree_agents.append(this_three)
+        # Project the locations once into the model's local metric CRS
+        self.easting, self.northing = model.projection.transform(self.lon, self.lat)
 
     @staticmethod
     def get_centroids(polygon, n, m):
@@ -74,17 +72,36 @@ class ForestArea:
         return centroids
 
     @staticmethod
-    def set_random_agent_location(polygon, n):
+    def set_random_agent_location(polygon, n, rng=None):
+        """
+        Sample exactly `n` uniformly distributed points inside the polygon.
 
-        minx, miny, maxx, maxy = polygon.bounds
+        Points are drawn in batches over the polygon bounds and tested all at once against the prepared
+        polygon; the rejected ones are drawn again until `n` points are accepted.
 
-        point_list = []
-        for ii in range(0, n):
-            random_point = Point(random.uniform(minx, maxx), random.uniform(miny, maxy))
+        :param polygon: The Shapely Polygon to place the points in.
+        :param n: Number of points.
+        :param rng: NumPy random Generator (a new unseeded one by default).
+        :return: Tuple with the arrays of longitudes and latitudes of the points.
+        """
+        if n <= 0:
+            return np.empty(0), np.empty(0)
+        if polygon.area <= 0:
+            raise ValueError("Cannot place agents in an area without surface")
 
-            if polygon.contains(random_point):
-                point_list.append(random_point)
+        rng = np.random.default_rng() if rng is None else rng
+        minx, miny, maxx, maxy = polygon.bounds
+        shapely.prepare(polygon)
 
-        return point_list
+        # Fraction of the draws expected to land inside the polygon
+        acceptance = polygon.area / ((maxx - minx) * (maxy - miny))
 
+        x, y = np.empty(0), np.empty(0)
+        while len(x) < n:
+            batch = int((n - len(x)) / acceptance * 1.1) + 16
+            x_batch = rng.uniform(minx, maxx, batch)
+            y_batch = rng.uniform(miny, maxy, batch)
+            inside = shapely.contains_xy(polygon, x_batch, y_batch)
+            x, y = np.concatenate([x, x_batch[inside]]), np.concatenate([y, y_batch[inside]])
 
+        return x[:n], y[:n]
@@ -1,70 +1,793 @@
-import pandas as pd
+import math
+import numpy as np
+import shapely
 from mesa import Model
-from mesa.time import RandomActivation
+from src.active_scheduler import ActiveFrontActivation, TreeActivation
+from src.checkpoint import save_checkpoint, load_checkpoint
+from src.distance_kernels import DISTANCE_KERNELS, PROJECTED_KERNELS
+from src.ensemble import run_ensemble
+from src.events import EventLog, BURNING, BURNED_OUT
 from src.forest_area_model import ForestArea
+from src.instrumentation import NoInstrumentation
+from src.neighbour_graph import NeighbourGraph, MAX_GRAPH_BYTES
+from src.projection import local_projection
+from src.raster_engine import RasterEngine
+from src.results_recorder import ResultsRecorder
+from src.results_store import ResultsWriter
+from src.spatial_index import BurningIndex, radius_in_degrees
+from src.transition_log import TransitionLog
+from src.tree_model import Tree, TreeAgents, TreeColumns, burn_out_step, heat_intensity, IGNITION_INTENSITY
+from src.vectorized_engine import VectorizedEngine, STATE_KEYS
+from shapely import STRtree
 from shapely.geometry import Point, Polygon
-from multiprocessing import Pool
 
 
 class ForestModel(Model):
 
-    def __init__(self, areas, wind_conditions, humidity_conditions, trees_per_agent=500):
+    # "agent" steps one Mesa Tree agent at a time, "vectorized" updates NumPy arrays of tree states,
+    # "raster" updates a regular grid of fuel cells with convolutions
+    ENGINES = ("agent", "vectorized", "raster")
+
+    # "snapshots" records every tree at every step, "transitions" only the trees that change and
+    # "store" every tree at every step into memory-mapped files on disk
+    RECORDS = ("snapshots", "transitions", "store")
+
+    # "random" activates every agent each step, "active_front" only those around the fire front
+    SCHEDULERS = ("random", "active_front")
+
+    # "sequential" agents see the changes of the agents activated before them in the same step,
+    # "synchronous" agents all read the state at the start of the step
+    UPDATES = ("sequential", "synchronous")
+
+    def __init__(self, areas, wind_conditions, humidity_conditions, trees_per_agent=500, spatial_index=True,
+                 engine="agent", distance_kernel="planar", scheduler="random", update=None, workers=1,
+                 neighbour_graph=False, graph_cache=None, graph_max_bytes=MAX_GRAPH_BYTES, temperature=20,
+                 weather=None, cell_size=None, seed=None, layout=None, instrumentation=None, events=None):
 
         super().__init__()
 
+        # Everything needed to build the same forest again (the seed and layout are given separately)
+        self.parameters = {"areas": areas,
+                           "wind_conditions": wind_conditions,
+                           "humidity_conditions": humidity_conditions,
+                           "trees_per_agent": trees_per_agent,
+                           "spatial_index": spatial_index,
+                           "engine": engine,
+                           "distance_kernel": distance_kernel,
+                           "scheduler": scheduler,
+                           "update": update,
+                           "workers": workers,
+                           "neighbour_graph": neighbour_graph,
+                           "graph_cache": graph_cache,
+                           "graph_max_bytes": graph_max_bytes,
+                           "temperature": temperature,
+                           "weather": weather,
+                           "cell_size": cell_size}
+
+        if engine not in self.ENGINES:
+            raise ValueError(f"Unknown engine '{engine}', expected one of {self.ENGINES}")
+        if distance_kernel not in DISTANCE_KERNELS:
+            raise ValueError(f"Unknown distance kernel '{distance_kernel}', expected one of {tuple(DISTANCE_KERNELS)}")
+        if scheduler not in self.SCHEDULERS:
+            raise ValueError(f"Unknown scheduler '{scheduler}', expected one of {self.SCHEDULERS}")
+
+        # The array engines are synchronous by construction, the agent engine sequential by default
+        update = update or ("sequential" if engine == "agent" else "synchronous")
+        if update not in self.UPDATES:
+            raise ValueError(f"Unknown update '{update}', expected one of {self.UPDATES}")
+        if engine != "agent" and update != "synchronous":
+            raise ValueError(f"The {engine} engine only supports the synchronous update")
+        if engine == "agent" and workers > 1:
+            raise ValueError("Parallel workers need the vectorized or raster engine")
+        if engine == "raster" and distance_kernel != "planar":
+            raise ValueError("The raster engine only supports the planar distance kernel")
+        if engine != "vectorized" and neighbour_graph:
+            raise ValueError("The neighbour graph needs the vectorized engine")
+
+        self.engine = engine
+        self.distance_kernel = distance_kernel
+        self.update = update
+        self.rng = np.random.default_rng(self.random.getrandbits(64))
+
+        # Agent placement has its own stream, so the simulation draws are the same with a given layout
+        self.placement_rng = self.rng.spawn(1)[0]
         self.areas = []
         self.fires = []
         self.tree_agents = []
         self.step_count = 0
         self.wind_conditions = wind_conditions
         self.humidity_conditions = humidity_conditions
-        self.schedule = RandomActivation(self)
+        self.humidity = humidity_conditions.get("humidity", 50)
+        self.temperature = temperature
+
+        # Opt-in Instrumentation with the time of the phases of every step and EventLog of the events of
+        # the trees (silent by default), not part of the parameters
+        self.instrumentation = NoInstrumentation() if instrumentation is None else instrumentation
+        self.events = EventLog(level="silent") if events is None else events
+
+        # Optional WeatherSchedule that replaces the conditions above at every step
+        self.weather = weather
+        if weather is not None:
+            self.update_weather(self.step_count + 1)
+
+        # Spatial index of the burning agents, rebuilt at every step (None scans every agent)
+        self.spatial_index = spatial_index
+        self.burning_index = None
+
+        # Static graph of the pairs of trees within the influence radius, built once and cached in
+        # `graph_cache` (a directory) to be reused by other runs of the same forest, up to `graph_max_bytes`
+        self.neighbour_graph = neighbour_graph
+        self.graph_cache = graph_cache
+        self.graph_max_bytes = graph_max_bytes
+        self.influence_radius = self.get_influence_radius()
+
+        # Local metric CRS where the tree locations are projected once
+        self.projection = local_projection([area["area"] for area in areas])
+
+        # Calculate number of trees, or reuse the agent locations of a previous model
+        for ii, area in enumerate(areas):
+            self.areas.append(ForestArea(area=area, trees_per_agent=trees_per_agent, model=self,
+                                         locations=None if layout is None else layout[ii]))
+
+        # Coordinates of every tree in the model order, as floats: Shapely Points are only created for
+        # the spatial indices. The areas keep views on their part of the arrays.
+        self.lon = np.concatenate([area.lon for area in self.areas]) if self.areas else np.empty(0)
+        self.lat = np.concatenate([area.lat for area in self.areas]) if self.areas else np.empty(0)
+        easting = np.concatenate([area.easting for area in self.areas]) if self.areas else np.empty(0)
+        northing = np.concatenate([area.northing for area in self.areas]) if self.areas else np.empty(0)
+        start = 0
+        for area in self.areas:
+            rows = slice(start, start + len(area.lon))
+            area.lon, area.lat = self.lon[rows], self.lat[rows]
+            area.easting, area.northing = easting[rows], northing[rows]
+            start = rows.stop
+        self.location_index = None
 
-        # Calculate number of trees
-        for area in areas:
-            self.areas.append(ForestArea(area=area, trees_per_agent=trees_per_agent, model=self))
-            self.tree_agents += self.areas[-1].tree_agents
+        # Tree agents of the agent engine: views on the shared columns with their position as id, created
+        # when they are accessed, and scheduled by their position
+        self.tree_columns = None
+        if engine == "agent":
+            self.tree_columns = TreeColumns(self.lon, self.lat, easting, northing, step_count=self.step_count)
+            self.tree_agents = TreeAgents(self.tree_columns, model=self)
+        schedule = ActiveFrontActivation if scheduler == "active_front" else TreeActivation
+        self.schedule = schedule(self, n_trees=len(self.tree_agents))
+
+        # Array engine of the vectorized and raster engines (the RasterEngine is a VectorizedEngine whose
+        # trees are the fuel cells of a grid)
+        self.vectorized_engine = None
+        if engine == "raster":
+            if cell_size is None:
+                # Cells hold on average the trees of one agent
+                density = sum(area.number_of_trees for area in self.areas) / max(
+                    sum(area.area_in_square_meters for area in self.areas), 1e-12)
+                cell_size = math.sqrt(trees_per_agent / density) if density > 0 else 100
+
+            self.vectorized_engine = RasterEngine.from_areas(areas=self.areas,
+                                                             projection=self.projection,
+                                                             cell_size=cell_size,
+                                                             trees_per_agent=trees_per_agent,
+                                                             rng=self.rng,
+                                                             workers=workers)
+            self.lon, self.lat = self.vectorized_engine.lon, self.vectorized_engine.lat
+        elif engine == "vectorized":
+            self.vectorized_engine = VectorizedEngine(
+                unique_ids=np.arange(len(self.lon)),
+                lon=self.lon,
+                lat=self.lat,
+                easting=easting,
+                northing=northing,
+                rng=self.rng,
+                distance_kernel=distance_kernel,
+                workers=workers)
+
+        if self.vectorized_engine is not None:
+            self.vectorized_engine.instrumentation = self.instrumentation
+            self.vectorized_engine.events = self.events
 
     def initialise_fire(self, fire_areas):
 
-        # Find tree_agents inside the area:
-        for fire in fire_areas:
-            self.fires.append(fire)
-            for tree_agent in self.tree_agents:
-                if tree_agent.location.within(fire["area"]):
-                    tree_agent.on_fire = True
+        # Find tree_agents inside any of the areas with a single query
+        self.fires += fire_areas
+        ignited = self.get_trees_within([fire["area"] for fire in fire_areas])
+
+        if self.vectorized_engine is not None:
+            self.vectorized_engine.initialise_fire(ignited)
+
+        # Only the agent engine has Tree agents, in the model order
+        if self.tree_columns is not None:
+            self.tree_columns.on_fire[ignited] = True
+
+        if isinstance(self.schedule, ActiveFrontActivation):
+            self.schedule.reset()
 
         return self.tree_agents
 
-    def run_simulation(self, simulation_time=100):
+    @classmethod
+    def from_checkpoint(cls, path, **overrides):
+        """
+        Resume a model from a checkpoint, reusing its agent locations instead of placing them again.
+
+        Every call builds an independent model, so many what-if continuations can branch from one
+        checkpoint. Constructor parameters given in `overrides` (e.g. wind_conditions or weather) replace
+        the saved ones. A `seed` override draws new random streams; otherwise the saved random state is
+        restored and the continuation is the same as the original run.
+
+        :param path: Path of a checkpoint written by `save_checkpoint`.
+        :param overrides: Constructor parameters to change.
+        :return: ForestModel.
+        """
+        checkpoint = load_checkpoint(path)
+        seed = overrides.pop("seed", None)
+
+        model = cls(seed=seed, layout=checkpoint["layout"], **{**checkpoint["parameters"], **overrides})
+        model.fires = checkpoint["fires"]
+        model.step_count = checkpoint["step_count"]
+        model.running = checkpoint["running"]
+        model.set_state(checkpoint["state"])
+
+        if seed is None:
+            model.set_schedule_order(checkpoint["schedule_order"], checkpoint["front_order"])
+            model.random.setstate(checkpoint["random_state"])
+            model.rng.bit_generator.state = checkpoint["rng_state"]
+            if model.vectorized_engine is not None:
+                model.vectorized_engine.seed = checkpoint["engine_seed"]
+
+        if model.weather is not None:
+            model.update_weather(model.step_count + 1)
+        model.influence_radius = model.get_influence_radius()
+
+        return model
+
+    def save_checkpoint(self, path):
+        """
+        Save the state of the model to resume it with `from_checkpoint`.
+
+        :param path: Path of the npz file.
+        """
+        save_checkpoint(self, path)
+
+    def get_schedule_order(self):
+        """
+        Order of the agents in the scheduler, which the next random shuffle starts from.
 
-        results_list = [t_a.__dict__.copy() for t_a in self.tree_agents]
-        for t in range(0, simulation_time):
-            self.step_count += 1
-            self.step()
-            results_list = results_list + [t_a.__dict__.copy() for t_a in self.tree_agents]
+        :return: Tuple with the positions (in the model order) of the scheduled agents and of the fire
+            front cached by the active front scheduler (None if there is none).
+        """
+        schedule_order = self.schedule.order.copy()
+
+        front_order = None
+        if isinstance(self.schedule, ActiveFrontActivation) and self.schedule.burning is not None:
+            front_order = np.array(self.schedule.burning, dtype=np.int64)
+
+        return schedule_order, front_order
+
+    def set_schedule_order(self, schedule_order, front_order=None):
+        """
+        Restore the order of the agents in the scheduler saved by `get_schedule_order`.
+
+        :param schedule_order: Positions of the scheduled agents in the model order.
+        :param front_order: Positions of the agents in the cached fire front, or None.
+        """
+        if not len(self.tree_agents):
+            return
+
+        self.schedule.order = np.asarray(schedule_order, dtype=np.int64).copy()
+        if front_order is not None and isinstance(self.schedule, ActiveFrontActivation):
+            self.schedule.set_front(front_order)
+
+    def set_state(self, state):
+        """
+        Overwrite the state of every tree, in the model order.
+
+        :param state: Dictionary of state arrays as returned by `get_state`.
+        """
+        if self.vectorized_engine is not None:
+            for key, values in self.vectorized_engine.get_state().items():
+                values[:] = state[key]
+        else:
+            columns = self.tree_columns
+            columns.on_fire[:] = state["on_fire"]
+            columns.is_burned[:] = state["is_burned"]
+            columns.current_time_on_fire[:] = state["current_time_on_fire"]
+            columns.burning_value[:] = state["burning_value"]
+            columns.color[:] = state["color"]
+            columns.step_count[:] = self.step_count
+
+        if isinstance(self.schedule, ActiveFrontActivation):
+            self.schedule.reset()
+
+    def get_trees_within(self, polygons):
+        """
+        Find the trees inside any of the polygons, testing the tree coordinates against every prepared
+        polygon, so no Shapely Point is created for the trees.
+
+        :param polygons: List of Shapely Polygons in lon/lat.
+        :return: Boolean array, in the model order.
+        """
+        inside = np.zeros(len(self.lon), dtype=bool)
+        for polygon in polygons:
+            shapely.prepare(polygon)
+            inside |= shapely.contains_xy(polygon, self.lon, self.lat)
+
+        return inside
+
+    def get_location_index(self):
+        """
+        :return: STRtree over the tree locations, built once since trees never move.
+        """
+        if self.location_index is None:
+            self.location_index = STRtree(shapely.points(self.lon, self.lat))
+
+        return self.location_index
+
+    def get_layout(self):
+        """
+        Agent locations of every area, to build the same forest again with the `layout` argument.
+
+        :return: List with an (n, 2) array of lon/lat per area.
+        """
+        return [np.column_stack([area.lon, area.lat]).reshape(-1, 2) for area in self.areas]
+
+    def run_ensemble(self, n_runs, simulation_time=100, seeds=None, processes=None, adaptive=False):
+        """
+        Run `n_runs` seeded realisations of this forest and fires across a process pool.
+
+        The geometry and agent placement of this model are reused by every realisation and only
+        per-run summaries are kept, aggregated into burn probabilities and percentile statistics.
+
+        :param n_runs: Number of realisations.
+        :param simulation_time: Number of steps of every realisation.
+        :param seeds: Optional list with the seed of every realisation (drawn from this model otherwise).
+        :param processes: Number of worker processes (None uses all the CPUs, 1 runs in this process).
+        :param adaptive: Stop the realisations once the fire is out and fast-forward their quiescent
+            steps (see `iter_states`).
+        :return: EnsembleResult.
+        """
+        return run_ensemble(self, n_runs=n_runs, simulation_time=simulation_time, seeds=seeds,
+                            processes=processes, adaptive=adaptive)
+
+    def run_simulation(self, simulation_time=100, record="snapshots", checkpoint_every=None, checkpoint_path=None,
+                       results_path=None, adaptive=False):
+        """
+        Run the simulation for `simulation_time` steps.
+
+        :param simulation_time: Number of steps.
+        :param record: "snapshots" to return a DataFrame with every tree at every step, "transitions" to
+            return a TransitionLog that only keeps the state changes and rebuilds any step on demand, or
+            "store" to write every step to `results_path` and return a ResultsReader that loads one step
+            at a time.
+        :param checkpoint_every: Save a checkpoint every this many steps (see `iter_states`).
+        :param checkpoint_path: Path of the checkpoints.
+        :param results_path: Directory of the results for the "store" record.
+        :param adaptive: Stop once the fire is out and fast-forward the quiescent steps (see `iter_states`).
+        :return: DataFrame, TransitionLog or ResultsReader.
+        """
+        if record not in self.RECORDS:
+            raise ValueError(f"Unknown record '{record}', expected one of {self.RECORDS}")
+        if record == "store" and results_path is None:
+            raise ValueError("The 'store' record needs a results_path")
+
+        if record == "transitions":
+            recorder = TransitionLog(lon=self.lon, lat=self.lat)
+        elif record == "store":
+            recorder = ResultsWriter(path=results_path, lon=self.lon, lat=self.lat, n_steps=simulation_time + 1)
+        else:
+            recorder = ResultsRecorder(lon=self.lon, lat=self.lat, n_steps=simulation_time + 1)
+
+        for step_count, state in self.iter_states(simulation_time, checkpoint_every, checkpoint_path, adaptive):
+            recorder.record(step_count, state)
 
         # create results dataframe
-        simulation_results = pd.DataFrame(results_list)
+        if record == "transitions":
+            simulation_results = recorder
+        elif record == "store":
+            recorder.close()
+            simulation_results = recorder.reader()
+        else:
+            simulation_results = recorder.to_frame()
 
-        print(f"Number of tree_agents burned is "
-              f"{len([t for t in self.tree_agents if t.is_burned])}"
-              f" of {len(self.tree_agents)}")
+        state = self.get_state()
+        print(f"Number of tree_agents burned is {int(state['is_burned'].sum())} of {len(state['is_burned'])}")
 
         return simulation_results
 
+    def iter_states(self, simulation_time=100, checkpoint_every=None, checkpoint_path=None, adaptive=False):
+        """
+        Run the simulation for `simulation_time` steps, yielding the state after every step.
+
+        The first item is the state before the first step. The yielded arrays may be views on the
+        engine state that the next step overwrites, so copy them to keep them.
+
+        In the adaptive mode the simulation stops once nothing can change anymore, and while no tree
+        can catch fire (see `quiescent_steps`) the steps up to the next burn-out are fast-forwarded
+        with `fast_forward_step` instead of being simulated, still yielding the state of every step. The
+        array engines draw the random numbers of a step from its own streams, so their results are the
+        same as without the adaptive mode. The agent engine makes no draws in the fast-forwarded steps,
+        so its runs are statistically equivalent but not the same sequence.
+
+        :param simulation_time: Number of steps.
+        :param checkpoint_every: Save a checkpoint every this many steps (None never saves).
+        :param checkpoint_path: Path of the checkpoints, overwritten every time unless it contains a
+            "{step_count}" field.
+        :param adaptive: Stop once the fire is out and fast-forward the quiescent steps.
+        :return: Generator of (step_count, state) tuples, with state as returned by `get_state`.
+        """
+        if checkpoint_every and checkpoint_path is None:
+            raise ValueError("checkpoint_every needs a checkpoint_path")
+
+        yield self.step_count, self.get_state()
+        fast_forward = 0
+        affected = None
+        try:
+            for t in range(0, simulation_time):
+                if adaptive and fast_forward == 0:
+                    if self.is_extinguished():
+                        self.running = False
+                        break
+
+                    # Only look for a quiescent period once a step ignites no tree, the check costs about
+                    # as much as the heat of a step while the fire spreads
+                    _, affected_now = self.count_burning()
+                    if affected_now == affected:
+                        fast_forward = self.quiescent_steps(simulation_time - t)
+                    affected = affected_now
+
+                self.step_count += 1
+                if fast_forward:
+                    self.fast_forward_step()
+                    fast_forward -= 1
+                else:
+                    self.step()
+
+                if checkpoint_every and self.step_count % checkpoint_every == 0:
+                    with self.instrumentation.phase("checkpoint"):
+                        self.save_checkpoint(checkpoint_path.format(step_count=self.step_count))
+
+                with self.instrumentation.phase("snapshot"):
+                    state = self.get_state()
+
+                yield self.step_count, state
+
+                # The active front scheduler stops the model once nothing can change
+                if not self.running:
+                    break
+        finally:
+            # Stop the capture of profiled steps the run did not reach
+            self.instrumentation.finish()
+
+    def iter_simulation(self, simulation_time=100, batch_size=1, checkpoint_every=None, checkpoint_path=None,
+                        adaptive=False):
+        """
+        Run the simulation for `simulation_time` steps, yielding the results as they are computed.
+
+        Only one batch is held at a time, so memory does not grow with the number of steps and the
+        first frame is available after the first `batch_size` steps.
+
+        :param simulation_time: Number of steps.
+        :param batch_size: Number of steps in every yielded frame.
+        :param checkpoint_every: Save a checkpoint every this many steps (see `iter_states`).
+        :param checkpoint_path: Path of the checkpoints.
+        :param adaptive: Stop once the fire is out and fast-forward the quiescent steps (see `iter_states`).
+        :return: Generator of DataFrames with the same columns as `run_simulation`, one per batch.
+        """
+        if batch_size < 1:
+            raise ValueError(f"batch_size must be at least 1, got {batch_size}")
+
+        recorder = None
+        for step_count, state in self.iter_states(simulation_time, checkpoint_every, checkpoint_path, adaptive):
+            if recorder is None:
+                recorder = ResultsRecorder(lon=self.lon, lat=self.lat, n_steps=batch_size)
+
+            recorder.record(step_count, state)
+            if recorder.n_recorded == batch_size:
+                yield recorder.to_frame()
+                recorder = None
+
+        # Last, incomplete batch
+        if recorder is not None:
+            yield recorder.to_frame()
+
+    def get_state(self):
+        """
+        State of every tree in the model order, whatever the engine.
+
+        :return: Dictionary with on_fire, is_burned, current_time_on_fire, burning_value and color (code) arrays.
+        """
+        if self.vectorized_engine is not None:
+            return self.vectorized_engine.get_state()
+
+        # The agents write their state to the shared columns, copied so later steps do not change it
+        columns = self.tree_columns
+        return {"on_fire": columns.on_fire.copy(),
+                "is_burned": columns.is_burned.copy(),
+                "current_time_on_fire": columns.current_time_on_fire.copy(),
+                "burning_value": columns.burning_value.copy(),
+                "color": columns.color.copy()}
+
+    def update_weather(self, step_count):
+        """
+        Set the wind, humidity and temperature of a step from the weather schedule.
+
+        :param step_count: Step about to run.
+        """
+        conditions = self.weather.conditions_for_step(step_count)
+        self.wind_conditions = {"speed": conditions["wind_speed"], "direction": conditions["wind_direction"]}
+        self.humidity = conditions["humidity"]
+        self.temperature = conditions["temperature"]
+
+    def get_influence_radius(self, conditions=None):
+        """
+        Cut-off radius of the heat intensity for the given weather (the current one by default).
+
+        :param conditions: Optional dictionary with wind_speed, humidity and temperature.
+        :return: Radius in meters.
+        """
+        if conditions is None:
+            return Tree.influence_radius(self.wind_conditions["speed"], humidity=self.humidity,
+                                         temperature=self.temperature)
+
+        return Tree.influence_radius(conditions["wind_speed"], humidity=conditions["humidity"],
+                                     temperature=conditions["temperature"])
+
     def step(self):
-        # # Use Pool to parallelize the stesps of agents
-        # with Pool(processes=4) as pool:
-        #     agents = list(self.schedule.agents)
-        #     pool.map(self._agent_step_wrapper, agents)
 
-        # After parallel step, perform any model-wide updates
-        self.schedule.step()
+        instrumentation = self.instrumentation
+        instrumentation.start_step(self.step_count)
+        if instrumentation.enabled:
+            _, affected_before = self.count_burning()
+
+        if self.weather is not None:
+            self.update_weather(self.step_count)
+        self.influence_radius = self.get_influence_radius()
+
+        if self.vectorized_engine is not None:
+
+            # The array engines step every tree
+            instrumentation.count("active", len(self.vectorized_engine))
+            if self.neighbour_graph:
+                with instrumentation.phase("neighbour_graph"):
+                    self.vectorized_engine.neighbour_graph = self.get_neighbour_graph()
+            self.vectorized_engine.step(wind_strength=self.wind_conditions["speed"],
+                                        wind_direction=self.wind_conditions["direction"],
+                                        influence_radius=self.influence_radius,
+                                        step_count=self.step_count,
+                                        humidity=self.humidity,
+                                        temperature=self.temperature)
+        else:
+            # Index the trees on fire at the start of the step so each tree only visits the nearby ones. In
+            # the synchronous update the index is the frozen set of sources every tree reads from.
+            with instrumentation.phase("burning_index"):
+                if self.update == "synchronous" or self.spatial_index:
+                    self.burning_index = self.get_burning_index(sources_only=self.update == "synchronous")
+
+            # The active front scheduler counts the agents it activates
+            if not isinstance(self.schedule, ActiveFrontActivation):
+                instrumentation.count("active", self.schedule.get_agent_count())
+            self.schedule.step()
+
+        if instrumentation.enabled:
+            burning, affected = self.count_burning()
+            instrumentation.count("burning", burning)
+            instrumentation.count("ignited", affected - affected_before)
+        instrumentation.end_step()
+
+    def get_burning_index(self, sources_only=False):
+        """
+        Index the trees on fire, read from the columns so the cost grows with the fire, not the forest.
+
+        :param sources_only: Only index the trees that already heat their neighbours
+            (`current_time_on_fire > 0`).
+        :return: BurningIndex with the trees in schedule order.
+        """
+        columns = self.tree_columns
+        ids = np.flatnonzero(columns.on_fire)
+        if sources_only:
+            ids = ids[columns.current_time_on_fire[ids] > 0]
+        ids = self.schedule.sort(ids)
+
+        return BurningIndex(ids, self.lon[ids], self.lat[ids])
+
+    def count_burning(self):
+        """
+        :return: Tuple with the number of trees on fire and the number of trees on fire or burned.
+        """
+        columns = self.vectorized_engine if self.vectorized_engine is not None else self.tree_columns
+        return int(columns.on_fire.sum()), int((columns.on_fire | columns.is_burned).sum())
+
+    def is_extinguished(self):
+        """
+        :return: Whether nothing can change anymore: no tree is on fire, or still smouldering after
+            burning out in the previous step.
+        """
+        columns = self.vectorized_engine if self.vectorized_engine is not None else self.tree_columns
+        return not (columns.on_fire.any() or (columns.is_burned & (columns.burning_value != 1)).any())
+
+    def quiescent_steps(self, max_steps):
+        """
+        Number of steps up to the next burn-out if no tree can catch fire until then: with the weather
+        of every one of those steps, the heat every unburned tree gets from all the trees on fire
+        (including those that only start heating their neighbours in a later step) is below
+        IGNITION_INTENSITY.
+
+        :param max_steps: Largest number of steps to return.
+        :return: Number of steps `fast_forward_step` can run, 0 if a tree may catch fire.
+        """
+        engine = self.vectorized_engine
+        if engine is not None:
+            columns, time_lasting_on_fire = engine, engine.time_lasting_on_fire
+        else:
+            columns, time_lasting_on_fire = self.tree_columns, self.tree_columns.time_lasting_on_fire
+
+        # With no tree on fire the burned trees only stop smouldering
+        sources = np.flatnonzero(columns.on_fire)
+        if len(sources) == 0:
+            return min(1, max_steps)
+
+        remaining = (time_lasting_on_fire - columns.current_time_on_fire)[sources]
+        n_steps = min(max(int(remaining.min()), 1), max_steps)
+
+        if self.weather is None:
+            conditions = [{"wind_speed": self.wind_conditions["speed"],
+                           "wind_direction": self.wind_conditions["direction"],
+                           "humidity": self.humidity,
+                           "temperature": self.temperature}]
+        else:
+            conditions = [self.weather.conditions_for_step(step_count)
+                          for step_count in range(self.step_count + 1, self.step_count + n_steps + 1)]
+        radius = max(self.get_influence_radius(condition) for condition in conditions)
+
+        # Unburned trees around the sources, with the search radius of the engines
+        source_idx, tree_idx = self.get_location_index().query(
+            shapely.points(self.lon[sources], self.lat[sources]), predicate="dwithin",
+            distance=radius_in_degrees(radius, np.abs(self.lat).max()))
+        unburned = ~columns.on_fire[tree_idx] & ~columns.is_burned[tree_idx]
+        source_idx, tree_idx = source_idx[unburned], tree_idx[unburned]
+        if len(tree_idx) == 0:
+            return n_steps
+
+        # Distance kernel and coordinates the engine works on (the raster engine is always planar)
+        if engine is not None:
+            kernel, x, y = engine.distance_kernel, engine.kernel_x, engine.kernel_y
+            fuel = engine.source_fuel(sources)[source_idx]
+        elif self.distance_kernel in PROJECTED_KERNELS:
+            kernel, x, y, fuel = self.distance_kernel, self.tree_columns.easting, self.tree_columns.northing, 1
+        else:
+            kernel, x, y, fuel = self.distance_kernel, self.lon, self.lat, 1
+        distance, angle_to_target = DISTANCE_KERNELS[kernel](
+            x[tree_idx], y[tree_idx], x[sources[source_idx]], y[sources[source_idx]])
+
+        for condition in conditions:
+            heat = np.bincount(tree_idx, weights=fuel * heat_intensity(distance, angle_to_target,
+                                                                       condition["wind_speed"],
+                                                                       condition["wind_direction"],
+                                                                       condition["humidity"],
+                                                                       condition["temperature"]))
+            if heat.max() >= IGNITION_INTENSITY:
+                return 0
+
+        return n_steps
+
+    def fast_forward_step(self):
+        """
+        Step in which no tree can catch fire (see `quiescent_steps`), computed with `burn_out_step`
+        without the heat of the sources or the random draws of `step`.
+        """
+        instrumentation = self.instrumentation
+        instrumentation.start_step(self.step_count)
+
+        if self.weather is not None:
+            self.update_weather(self.step_count)
+        self.influence_radius = self.get_influence_radius()
+
+        with instrumentation.phase("burn_out"):
+            if self.vectorized_engine is not None:
+                engine = self.vectorized_engine
+                state, time_lasting_on_fire = engine.state, engine.time_lasting_on_fire
+                unique_ids = engine.unique_ids
+            else:
+                columns = self.tree_columns
+                state = {key: getattr(columns, key) for key in STATE_KEYS}
+                time_lasting_on_fire, unique_ids = columns.time_lasting_on_fire, np.arange(len(columns.on_fire))
+                columns.step_count[:] = self.step_count
+
+            burning, burned_out = burn_out_step(state, time_lasting_on_fire)
+
+        with instrumentation.phase("events"):
+            self.events.record_many(self.step_count, unique_ids[burning], BURNING)
+            self.events.record_many(self.step_count, unique_ids[burned_out], BURNED_OUT)
+
+        # The fire front cached by the active front scheduler is not the one it left anymore
+        if isinstance(self.schedule, ActiveFrontActivation):
+            self.schedule.reset()
+
+        if instrumentation.enabled:
+            instrumentation.count("burning", int(state["on_fire"].sum()))
+        instrumentation.end_step()
+
+    def get_neighbour_graph(self):
+        """
+        Static neighbour graph of the trees, built again only if the influence radius grows beyond
+        the radius it was built with. With a weather schedule it is built for the largest radius of
+        the schedule, so the weather changes never rebuild it.
+
+        :return: NeighbourGraph.
+        :raise MemoryError: If the graph is expected not to fit in `graph_max_bytes`.
+        """
+        engine = self.vectorized_engine
+        graph = engine.neighbour_graph
+        if graph is None or graph.radius < self.influence_radius:
+            radius = self.influence_radius
+            if self.weather is not None:
+                radius = max([radius] + [self.get_influence_radius(conditions)
+                                         for conditions in self.weather.all_conditions()])
+
+            # Fail before building a graph that would not fit in memory
+            NeighbourGraph.check_size(NeighbourGraph.estimate_edges([len(area.lon) for area in self.areas],
+                                                                    [area.area_in_square_meters for area in self.areas],
+                                                                    radius),
+                                      self.graph_max_bytes)
+            graph = NeighbourGraph.cached(cache_dir=self.graph_cache,
+                                          lon=engine.lon,
+                                          lat=engine.lat,
+                                          x=engine.kernel_x,
+                                          y=engine.kernel_y,
+                                          distance_kernel=self.distance_kernel,
+                                          radius=radius,
+                                          max_bytes=self.graph_max_bytes)
+
+        return graph
+
+    def get_burning_sources(self, location):
+        """
+        Return the burning trees that can heat a tree at `location` (see `get_burning_source_ids`).
+
+        :param location: Shapely Point of the tree being heated.
+        :return: List of Tree agents.
+        """
+        return [self.tree_agents[ii] for ii in self.get_burning_source_ids(location)]
+
+    def get_burning_source_ids(self, location):
+        """
+        Return the positions of the burning trees that can heat a tree at `location`.
+
+        Trees that catch fire during the step are not indexed, but they only start heating their
+        neighbours once `current_time_on_fire > 0`, i.e. from the next step on. In the sequential
+        update the live state is still checked so that the result matches a scan over all the agents,
+        in the synchronous update the sources at the start of the step are returned.
+
+        :param location: Shapely Point of the tree being heated.
+        :return: Array of positions in the model order.
+        """
+        if self.update == "synchronous":
+            if self.spatial_index:
+                return self.burning_index.query(location, self.influence_radius)
+            return self.burning_index.ids
+
+        if self.burning_index is None:
+            ids = self.schedule.order
+        else:
+            ids = self.burning_index.query(location, self.influence_radius)
+
+        # Read the state of the candidates from the shared columns instead of agent by agent
+        burning = self.tree_columns.on_fire[ids] & (self.tree_columns.current_time_on_fire[ids] > 0)
+
+        return ids[burning]
+
+    def get_distances(self, tree, sources):
+        """
+        Distances and directions from `tree` to each of the `sources` with the model's distance kernel.
+
+        :param tree: Tree agent being heated.
+        :param sources: Array with the positions of the burning trees, or list of burning Tree agents.
+        :return: Tuple with the arrays of distances in meters and directions in degrees.
+        """
+        kernel = DISTANCE_KERNELS[self.distance_kernel]
+        ids = sources if isinstance(sources, np.ndarray) else np.fromiter(
+            (source.unique_id for source in sources), dtype=np.int64, count=len(sources))
+        if self.distance_kernel in PROJECTED_KERNELS:
+            return kernel(tree.easting, tree.northing, self.tree_columns.easting[ids], self.tree_columns.northing[ids])
 
-    @staticmethod
-    def _agent_step_wrapper(self, agent):
-        agent.step()
+        return kernel(self.lon[tree.unique_id], self.lat[tree.unique_id], self.lon[ids], self.lat[ids])
 
 
 if __name__ == "__main__":
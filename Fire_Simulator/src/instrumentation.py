@@ -0,0 +1,137 @@
+import contextlib
+import cProfile
+import pstats
+import threading
+import time
+import tracemalloc
+import numpy as np
+import pandas as pd
+
+# Context of the phases when the instrumentation is disabled, shared so a phase costs no allocation
+_NO_PHASE = contextlib.nullcontext()
+
+
+class NoInstrumentation:
+    """
+    Instrumentation of a model that records nothing, the default of ForestModel. Every method is a
+    no-op so the instrumented code costs next to nothing when the instrumentation is disabled.
+    """
+    enabled = False
+
+    def phase(self, name):
+        return _NO_PHASE
+
+    def count(self, name, n=1):
+        pass
+
+    def start_step(self, step_count):
+        pass
+
+    def end_step(self):
+        pass
+
+    def finish(self):
+        pass
+
+
+class Instrumentation(NoInstrumentation):
+    enabled = True
+
+    def __init__(self, profile_steps=None, trace_memory=False):
+        """
+        Records the wall time of every step and of the phases it goes through (spatial queries, distance
+        kernels, intensity, random draws, snapshot copies...), and counters such as the burning,
+        ignited and active agents and the number of intensity evaluations, one row per step.
+
+        Phases are not nested, so the step time minus the time of its phases is the time spent outside
+        of any phase. With `workers > 1` the phases of the engine blocks add up the time of every thread.
+
+        :param profile_steps: Optional (first, last) steps, both included, to capture with cProfile.
+        :param trace_memory: Also capture a tracemalloc snapshot of the allocations of the profiled steps.
+        """
+        self.profile_steps = profile_steps
+        self.trace_memory = trace_memory
+        self.rows = []
+        self.current = {}
+        self.step_start = None
+        self.lock = threading.Lock()
+
+        # Results of the capture of the profiled steps
+        self.profiler = None
+        self.stop_tracing = False
+        self.profile = None
+        self.memory_snapshot = None
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.count(f"time_{name}", time.perf_counter() - start)
+
+    def count(self, name, n=1):
+        with self.lock:
+            self.current[name] = self.current.get(name, 0) + n
+
+    def start_step(self, step_count):
+        """
+        Start the row of a step. Phases and counts go to it until the next step starts, so the copy of
+        the state after the step is counted in it too.
+
+        :param step_count: Step about to run.
+        """
+        self.current = {"step_count": step_count}
+        self.rows.append(self.current)
+
+        if self.profile_steps is not None and step_count == self.profile_steps[0]:
+            if self.trace_memory and not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self.stop_tracing = True
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+
+        self.step_start = time.perf_counter()
+
+    def end_step(self):
+        self.current["step_time"] = time.perf_counter() - self.step_start
+
+        if self.profiler is not None and self.current["step_count"] >= self.profile_steps[1]:
+            self.finish()
+
+    def finish(self):
+        """
+        Stop the capture of the profiled steps, at their last step or when the run ends before it, so
+        the profiler and tracemalloc never keep running after the run.
+        """
+        if self.profiler is None:
+            return
+
+        self.profiler.disable()
+        self.profile = pstats.Stats(self.profiler)
+        self.profiler = None
+        if self.trace_memory:
+            self.memory_snapshot = tracemalloc.take_snapshot()
+            if self.stop_tracing:
+                tracemalloc.stop()
+                self.stop_tracing = False
+
+    def to_frame(self):
+        """
+        Metrics of every step.
+
+        :return: DataFrame with the step_count, the step_time and the time_<phase> of every phase in
+            seconds, and one integer column per counter.
+        """
+        frame = pd.DataFrame(self.rows)
+        if frame.empty:
+            return pd.DataFrame({"step_count": [], "step_time": []})
+
+        times = sorted(column for column in frame.columns if column.startswith("time_"))
+        counters = sorted(column for column in frame.columns if column not in times + ["step_count", "step_time"])
+
+        # Steps without a phase or a count have none of its time or count
+        frame = frame[["step_count", "step_time"] + times + counters].fillna(0)
+        frame[counters] = frame[counters].astype(np.int64)
+
+        return frame
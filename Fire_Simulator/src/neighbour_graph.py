@@ -0,0 +1,252 @@
+import hashlib
+import math
+import os
+import numpy as np
+import shapely
+from shapely import STRtree
+from src.atomic_file import atomic_path
+from src.distance_kernels import DISTANCE_KERNELS
+from src.spatial_index import radius_in_degrees
+from src.tree_model import angular_influence, weather_factor, DISTANCE_DECAY
+
+# Number of trees whose neighbours are searched at once while building the graph
+BUILD_BLOCK_SIZE = 1024
+
+# Bytes of every edge: heated tree (int32), distance factor and direction (float32), and the cached
+# weight for a repeated wind direction (float32)
+EDGE_BYTES = 16
+
+# Number of edges summed at once by `NeighbourGraph.intensity`, the unit of work of a worker
+EDGE_BLOCK_SIZE = 2 ** 20
+
+# Default memory budget of a graph
+MAX_GRAPH_BYTES = 2 * 1024 ** 3
+
+# Version of the stored graphs, part of the cache key so that files in an older format are not loaded
+GRAPH_FORMAT = 2
+
+
+def graph_key(lon, lat, distance_kernel, radius):
+    """
+    Hash identifying the graph of a forest, used as the name of its cache file.
+
+    :param lon: Longitude of every tree.
+    :param lat: Latitude of every tree.
+    :param distance_kernel: Name of the kernel in DISTANCE_KERNELS.
+    :param radius: Cutoff radius in meters.
+    :return: Hexadecimal string.
+    """
+    digest = hashlib.sha1()
+    digest.update(np.ascontiguousarray(lon, dtype=float).tobytes())
+    digest.update(np.ascontiguousarray(lat, dtype=float).tobytes())
+    digest.update(f"{distance_kernel}:{float(radius)!r}:{GRAPH_FORMAT}".encode())
+
+    return digest.hexdigest()
+
+
+class NeighbourGraph:
+
+    def __init__(self, indptr, indices, distance_factor, angle_to_target, radius):
+        """
+        Static graph of the pairs of trees closer than `radius`, in CSR form by burning tree: the trees
+        that tree `j` heats are `indices[indptr[j]:indptr[j + 1]]`, with the distance term of the heat
+        intensity between them and the direction from each heated tree to `j`. The edge values are
+        float32 to fit the large graphs of dense forests (about EDGE_BYTES per edge).
+
+        Trees never move, so the graph is built once per forest with the distance term of every edge,
+        and a change of weather never rebuilds it. Every step only visits the contiguous edges of the
+        burning trees (`intensity`): it weights them with the angle to the wind and sums them per heated
+        tree times the weather factor. The angular weights of all the edges are kept once the wind
+        direction repeats between steps.
+
+        :param indptr: Array (n + 1) with the first edge of every tree.
+        :param indices: Array with the heated tree of every edge.
+        :param distance_factor: Array with exp(-distance / DISTANCE_DECAY) of every edge.
+        :param angle_to_target: Array with the direction (degrees) from the heated tree to the burning tree.
+        :param radius: Cutoff radius in meters the graph was built with.
+        """
+        self.indptr = np.asarray(indptr, dtype=np.int64)
+        self.indices = np.asarray(indices, dtype=np.int32)
+        self.distance_factor = np.asarray(distance_factor, dtype=np.float32)
+        self.angle_to_target = np.asarray(angle_to_target, dtype=np.float32)
+        self.radius = float(radius)
+
+        # Wind direction of the previous step and the weights of every edge for it, if it repeated
+        self.wind_direction = None
+        self.weights = None
+
+    def __len__(self):
+        return len(self.indptr) - 1
+
+    @property
+    def n_edges(self):
+        return len(self.indices)
+
+    @staticmethod
+    def estimate_edges(n_trees, areas_in_square_meters, radius):
+        """
+        Expected number of edges of the graph of trees spread uniformly over their areas: every tree has
+        about density x pi r^2 neighbours.
+
+        :param n_trees: Number of trees of every area.
+        :param areas_in_square_meters: Size of every area.
+        :param radius: Cutoff radius in meters.
+        :return: Number of edges.
+        """
+        edges = 0
+        for n, area in zip(n_trees, areas_in_square_meters):
+            if n > 1 and area > 0:
+                edges += min(n * n * math.pi * radius ** 2 / area, n * (n - 1))
+
+        return int(edges)
+
+    @staticmethod
+    def check_size(n_edges, max_bytes):
+        """
+        :param n_edges: Number of edges of a graph.
+        :param max_bytes: Memory budget of the graph (None for no limit).
+        :raise MemoryError: If the edges do not fit in the budget.
+        """
+        if max_bytes is not None and n_edges * EDGE_BYTES > max_bytes:
+            raise MemoryError(f"The neighbour graph needs about {n_edges * EDGE_BYTES / 1024 ** 2:.0f} MB "
+                              f"({n_edges} edges), more than its budget of {max_bytes / 1024 ** 2:.0f} MB: "
+                              f"use more trees per agent, a smaller forest or the default spatial index")
+
+    @classmethod
+    def build(cls, lon, lat, x, y, distance_kernel, radius, max_bytes=None):
+        """
+        Find every pair of trees closer than `radius`. A first pass counts the edges of every tree, so
+        the edges are written into arrays of their final size by the second one.
+
+        :param lon: Longitude of every tree.
+        :param lat: Latitude of every tree.
+        :param x: Coordinates the distance kernel works on (easting or longitude).
+        :param y: Coordinates the distance kernel works on (northing or latitude).
+        :param distance_kernel: Name of the kernel in DISTANCE_KERNELS.
+        :param radius: Cutoff radius in meters.
+        :param max_bytes: Memory budget of the graph (None for no limit).
+        :return: NeighbourGraph.
+        :raise MemoryError: If the graph does not fit in `max_bytes`.
+        """
+        locations = shapely.points(lon, lat)
+        n = len(locations)
+        tree = STRtree(locations)
+        search_radius = radius_in_degrees(radius, np.abs(lat).max() if n else 0)
+
+        def block_edges(start, sort=True):
+
+            # Pairs of a block (sorted by burning tree, then heated tree) within the radius
+            block = np.arange(start, min(start + BUILD_BLOCK_SIZE, n))
+            source_idx, tree_idx = tree.query(locations[block], predicate="dwithin", distance=search_radius)
+            source_idx = block[source_idx]
+            if sort:
+                order = np.lexsort((tree_idx, source_idx))
+                source_idx, tree_idx = source_idx[order], tree_idx[order]
+            distance, angle_to_target = DISTANCE_KERNELS[distance_kernel](x[tree_idx], y[tree_idx],
+                                                                          x[source_idx], y[source_idx])
+            keep = (tree_idx != source_idx) & (distance <= radius)
+
+            return block, source_idx[keep], tree_idx[keep], distance[keep], angle_to_target[keep]
+
+        counts = np.zeros(n, dtype=np.int64)
+        for start in range(0, n, BUILD_BLOCK_SIZE):
+            block, source_idx, *_ = block_edges(start, sort=False)
+            counts[block] = np.bincount(source_idx - start, minlength=len(block))
+
+        indptr = np.concatenate([[0], np.cumsum(counts)])
+        cls.check_size(int(indptr[-1]), max_bytes)
+
+        indices = np.empty(indptr[-1], dtype=np.int32)
+        distance_factor = np.empty(indptr[-1], dtype=np.float32)
+        angles = np.empty(indptr[-1], dtype=np.float32)
+        for start in range(0, n, BUILD_BLOCK_SIZE):
+            block, _, tree_idx, distance, angle_to_target = block_edges(start)
+            edges = slice(indptr[block[0]], indptr[block[-1] + 1])
+            indices[edges] = tree_idx
+            distance_factor[edges] = np.exp(-distance / DISTANCE_DECAY)
+            angles[edges] = angle_to_target
+
+        return cls(indptr=indptr, indices=indices, distance_factor=distance_factor, angle_to_target=angles,
+                   radius=radius)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(indptr=data["indptr"], indices=data["indices"], distance_factor=data["distance_factor"],
+                       angle_to_target=data["angle_to_target"], radius=data["radius"])
+
+    def save(self, path):
+        np.savez(path, indptr=self.indptr, indices=self.indices, distance_factor=self.distance_factor,
+                 angle_to_target=self.angle_to_target, radius=self.radius)
+
+    @classmethod
+    def cached(cls, cache_dir, lon, lat, x, y, distance_kernel, radius, max_bytes=None):
+        """
+        Load the graph of the forest from `cache_dir`, building and saving it the first time.
+
+        :param cache_dir: Directory of the cached graphs (None disables the cache).
+        :param lon: Longitude of every tree.
+        :param lat: Latitude of every tree.
+        :param x: Coordinates the distance kernel works on.
+        :param y: Coordinates the distance kernel works on.
+        :param distance_kernel: Name of the kernel in DISTANCE_KERNELS.
+        :param radius: Cutoff radius in meters.
+        :param max_bytes: Memory budget of the graph (None for no limit).
+        :return: NeighbourGraph.
+        """
+        if cache_dir is None:
+            return cls.build(lon, lat, x, y, distance_kernel, radius, max_bytes)
+
+        path = os.path.join(cache_dir, f"{graph_key(lon, lat, distance_kernel, radius)}.npz")
+        if os.path.exists(path):
+            return cls.load(path)
+
+        graph = cls.build(lon, lat, x, y, distance_kernel, radius, max_bytes)
+        os.makedirs(cache_dir, exist_ok=True)
+
+        with atomic_path(path) as temporary, open(temporary, "wb") as file:
+            graph.save(file)
+
+        return graph
+
+    def intensity(self, sources, wind_strength, wind_direction, humidity=50, temperature=20, map_chunks=map):
+        """
+        Sparse matrix-vector product of the edge weights with the burning sources.
+
+        The edges of the sources are summed in chunks of EDGE_BLOCK_SIZE, whose partial sums are added
+        in chunk order, so the result does not depend on how `map_chunks` runs them.
+
+        :param sources: Indices of the trees that heat their neighbours.
+        :param wind_strength: Wind speed.
+        :param wind_direction: Wind direction in degrees.
+        :param humidity: Relative humidity in percent.
+        :param temperature: Temperature in degrees Celsius.
+        :param map_chunks: Function like `map` that applies the sum of a chunk to every chunk.
+        :return: Array with the total heat intensity every tree gets.
+        """
+        # Concatenate the edge ranges of the sources without a Python loop
+        starts = self.indptr[sources]
+        counts = self.indptr[np.asarray(sources) + 1] - starts
+        offsets = np.repeat(starts - np.cumsum(counts) + counts, counts)
+        edges = offsets + np.arange(counts.sum())
+
+        # Weight every edge once if the wind direction holds, otherwise only the edges of the sources
+        if wind_direction == self.wind_direction and self.weights is None:
+            self.weights = self.distance_factor * angular_influence(self.angle_to_target, wind_direction)
+        elif wind_direction != self.wind_direction:
+            self.wind_direction, self.weights = wind_direction, None
+
+        def chunk_intensity(start):
+            chunk = edges[start:start + EDGE_BLOCK_SIZE]
+            if self.weights is None:
+                weights = self.distance_factor[chunk] * angular_influence(self.angle_to_target[chunk], wind_direction)
+            else:
+                weights = self.weights[chunk]
+
+            return np.bincount(self.indices[chunk], weights=weights, minlength=len(self))
+
+        intensity = np.zeros(len(self))
+        for partial in map_chunks(chunk_intensity, range(0, len(edges), EDGE_BLOCK_SIZE)):
+            intensity += partial
+
+        return weather_factor(wind_strength, humidity, temperature) * intensity
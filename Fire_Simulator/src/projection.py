@@ -0,0 +1,67 @@
+import pyproj
+import shapely
+from functools import lru_cache
+
+
+@lru_cache(maxsize=None)
+def get_transformer(crs_from, crs_to):
+    """
+    Shared Transformer between two CRS, built once per pair.
+
+    :param crs_from: Source CRS (any hashable value accepted by pyproj, e.g. "EPSG:4326").
+    :param crs_to: Target CRS.
+    :return: pyproj Transformer with always_xy=True.
+    """
+    return pyproj.Transformer.from_crs(crs_from, crs_to, always_xy=True)
+
+
+def utm_crs(lon, lat):
+    """
+    UTM zone CRS (WGS84) that contains the given location.
+
+    :param lon: Longitude.
+    :param lat: Latitude.
+    :return: EPSG code string, e.g. "EPSG:32630".
+    """
+    zone = int((lon + 180) // 6) % 60 + 1
+    return f"EPSG:{(32600 if lat >= 0 else 32700) + zone}"
+
+
+def area_in_square_meters(polygon):
+    """
+    Area of a lon/lat polygon, projected into the UTM zone of its centroid.
+
+    :param polygon: Shapely Polygon in lon/lat.
+    :return: Area in square meters.
+    """
+    centroid = polygon.centroid
+    if centroid.is_empty:
+        return 0.0
+
+    project = get_transformer("EPSG:4326", utm_crs(centroid.x, centroid.y)).transform
+    return shapely.transform(polygon, project, interleaved=False).area
+
+
+def local_crs(lon, lat):
+    """
+    Azimuthal equidistant CRS in meters centred on (lon, lat), accurate for distances around it.
+
+    :param lon: Longitude of the centre.
+    :param lat: Latitude of the centre.
+    :return: pyproj CRS.
+    """
+    return pyproj.CRS.from_proj4(f"+proj=aeqd +lat_0={lat} +lon_0={lon} +datum=WGS84 +units=m +no_defs")
+
+
+def local_projection(polygons):
+    """
+    Transformer from lon/lat (EPSG:4326) to the local metric CRS centred on the given polygons.
+
+    :param polygons: List of Shapely Polygons in lon/lat.
+    :return: pyproj Transformer with always_xy=True.
+    """
+    centroid = shapely.union_all(polygons).centroid if polygons else shapely.Point(0, 0)
+    if centroid.is_empty:
+        centroid = shapely.Point(0, 0)
+
+    return get_transformer("EPSG:4326", local_crs(centroid.x, centroid.y))
@@ -0,0 +1,197 @@
+import math
+import numpy as np
+import shapely
+from src.tree_model import angular_influence, weather_factor, DISTANCE_DECAY
+from src.vectorized_engine import VectorizedEngine
+
+# Number of grid lines transformed at once by the FFTs, the unit of work of a worker
+FFT_BLOCK_SIZE = 256
+
+
+class RasterEngine(VectorizedEngine):
+
+    def __init__(self, rows, cols, fuel, cell_size, shape, easting, northing, lon, lat, rng, workers=1,
+                 time_lasting_on_fire=5):
+        """
+        Fire spread engine on a regular grid of square cells in the local metric CRS. Every cell with
+        fuel behaves like a tree of the vectorized engine (same state arrays, rules and random streams),
+        but the heat every cell gets is the convolution of the burning fuel grid with a heat kernel,
+        computed with FFTs instead of pairwise distances.
+
+        :param rows: Array with the grid row of every fuel cell (rows grow northwards).
+        :param cols: Array with the grid column of every fuel cell (columns grow eastwards).
+        :param fuel: Array with the heat weight of every fuel cell (1 for the trees of one agent).
+        :param cell_size: Side of the cells in meters.
+        :param shape: Shape (rows, columns) of the grid.
+        :param easting: Projected x coordinates of the cell centres in meters.
+        :param northing: Projected y coordinates of the cell centres in meters.
+        :param lon: Longitude of the cell centres.
+        :param lat: Latitude of the cell centres.
+        :param rng: NumPy random Generator the seed of the random streams is drawn from.
+        :param workers: Number of threads that process the blocks and the lines of the FFTs.
+        :param time_lasting_on_fire: Number of steps a cell burns before it is burned.
+        """
+        super().__init__(unique_ids=np.arange(len(fuel)),
+                         lon=lon,
+                         lat=lat,
+                         easting=easting,
+                         northing=northing,
+                         rng=rng,
+                         distance_kernel="planar",
+                         workers=workers,
+                         time_lasting_on_fire=time_lasting_on_fire)
+
+        self.rows = np.asarray(rows, dtype=np.int64)
+        self.cols = np.asarray(cols, dtype=np.int64)
+        self.fuel = np.asarray(fuel, dtype=float)
+        self.cell_size = cell_size
+        self.shape = tuple(shape)
+
+        # Heat kernel, rebuilt when the wind direction or the radius in cells changes
+        self.kernel_key = None
+        self.kernel_spectrum = None
+
+    @classmethod
+    def from_areas(cls, areas, projection, cell_size, trees_per_agent, rng, workers=1):
+        """
+        Rasterize the forest areas into a fuel grid.
+
+        :param areas: List of ForestArea.
+        :param projection: Transformer from lon/lat to the local metric CRS.
+        :param cell_size: Side of the cells in meters.
+        :param trees_per_agent: Number of trees that give a fuel weight of 1.
+        :param rng: NumPy random Generator.
+        :param workers: Number of threads that process the blocks.
+        :return: RasterEngine.
+        """
+        polygons = [shapely.transform(area.area, projection.transform, interleaved=False) for area in areas]
+        minx, miny, maxx, maxy = shapely.union_all(polygons).bounds if polygons else (0, 0, 0, 0)
+        shape = (max(math.ceil((maxy - miny) / cell_size), 1), max(math.ceil((maxx - minx) / cell_size), 1))
+
+        # Trees in every cell whose centre is inside each area
+        northing, easting = np.meshgrid(miny + (np.arange(shape[0]) + 0.5) * cell_size,
+                                        minx + (np.arange(shape[1]) + 0.5) * cell_size, indexing="ij")
+        trees = np.zeros(shape)
+        for area, polygon in zip(areas, polygons):
+            shapely.prepare(polygon)
+            density = sum(tree_group["tree_density_m"] for tree_group in area.trees_properties)
+            trees[shapely.contains_xy(polygon, easting, northing)] += density * cell_size ** 2
+
+        rows, cols = np.nonzero(trees)
+        lon, lat = projection.transform(easting[rows, cols], northing[rows, cols], direction="INVERSE")
+
+        return cls(rows=rows, cols=cols, fuel=trees[rows, cols] / trees_per_agent, cell_size=cell_size,
+                   shape=shape, easting=easting[rows, cols], northing=northing[rows, cols], lon=lon, lat=lat,
+                   rng=rng, workers=workers)
+
+    def heat_kernel(self, wind_direction, radius):
+        """
+        Distance and angular terms of the heat a cell gets from a burning cell at every offset.
+
+        :param wind_direction: Wind direction in degrees.
+        :param radius: Radius of the kernel in cells.
+        :return: Array (2 * radius + 1, 2 * radius + 1), indexed by the row and column offsets + radius.
+        """
+        offset = np.arange(-radius, radius + 1) * self.cell_size
+        dy, dx = np.meshgrid(offset, offset, indexing="ij")
+
+        # Direction from the heated cell to the burning cell, as the planar distance kernel
+        kernel = (np.exp(-np.hypot(dx, dy) / DISTANCE_DECAY) *
+                  angular_influence(np.degrees(np.arctan2(dy, dx)), wind_direction))
+        kernel[radius, radius] = 0
+
+        return kernel
+
+    def map_lines(self, function, n_lines):
+        """
+        Apply a function to the lines of a grid in chunks of FFT_BLOCK_SIZE lines, in the worker threads
+        if there are several. Every line is transformed on its own, so the result does not depend on
+        how the chunks are run.
+
+        :param function: Function of a slice of lines that writes their result.
+        :param n_lines: Number of lines.
+        """
+        list(self.map(lambda start: function(slice(start, start + FFT_BLOCK_SIZE)), range(0, n_lines, FFT_BLOCK_SIZE)))
+
+    def rfft2(self, grid, size):
+        """
+        Two-dimensional real FFT of a grid zero padded to `size`, as `np.fft.rfft2`: the rows first and
+        then the columns, each split across the workers.
+
+        :param grid: Real array with at most `size` rows and columns.
+        :param size: Shape (rows, columns) of the transform.
+        :return: Complex array (size[0], size[1] // 2 + 1).
+        """
+        rows = np.empty((grid.shape[0], size[1] // 2 + 1), dtype=complex)
+        spectrum = np.empty((size[0], size[1] // 2 + 1), dtype=complex)
+
+        def transform_rows(lines):
+            rows[lines] = np.fft.rfft(grid[lines], n=size[1], axis=1)
+
+        def transform_columns(lines):
+            spectrum[:, lines] = np.fft.fft(rows[:, lines], n=size[0], axis=0)
+
+        self.map_lines(transform_rows, grid.shape[0])
+        self.map_lines(transform_columns, spectrum.shape[1])
+
+        return spectrum
+
+    def irfft2(self, spectrum, size, rows):
+        """
+        Inverse of `rfft2`, only for the rows that are kept: the columns first and then the rows, each
+        split across the workers.
+
+        :param spectrum: Complex array (size[0], size[1] // 2 + 1).
+        :param size: Shape (rows, columns) of the transform.
+        :param rows: Slice with the rows of the result to compute.
+        :return: Real array (rows, size[1]).
+        """
+        columns = np.empty(spectrum.shape, dtype=complex)
+        kept = columns[rows]
+        grid = np.empty((len(kept), size[1]))
+
+        def transform_columns(lines):
+            columns[:, lines] = np.fft.ifft(spectrum[:, lines], n=size[0], axis=0)
+
+        def transform_rows(lines):
+            grid[lines] = np.fft.irfft(kept[lines], n=size[1], axis=1)
+
+        self.map_lines(transform_columns, spectrum.shape[1])
+        self.map_lines(transform_rows, len(kept))
+
+        return grid
+
+    def source_fuel(self, sources):
+        """
+        :param sources: Indices of the burning cells.
+        :return: Array with the fuel of every source, which scales its heat.
+        """
+        return self.fuel[sources]
+
+    def source_intensity(self, sources, wind_strength, wind_direction, influence_radius, humidity=50, temperature=20):
+        """
+        Heat intensity every cell gets, correlating the grid of burning fuel with the heat kernel.
+        """
+        if len(sources) == 0:
+            return np.zeros(len(self))
+
+        radius = max(math.ceil(influence_radius / self.cell_size), 1)
+        size = (self.shape[0] + 2 * radius, self.shape[1] + 2 * radius)
+
+        # The kernel spectrum only changes with the wind direction or the radius
+        if self.kernel_key != (wind_direction, radius):
+            flipped = self.heat_kernel(wind_direction, radius)[::-1, ::-1]
+            self.kernel_spectrum = self.rfft2(flipped, size)
+            self.kernel_key = (wind_direction, radius)
+
+        # One evaluation per cell, whatever the number of burning cells
+        self.instrumentation.count("intensity_evaluations", len(self))
+
+        burning = np.zeros(self.shape)
+        burning[self.rows[sources], self.cols[sources]] = self.fuel[sources]
+
+        heat = self.irfft2(self.rfft2(burning, size) * self.kernel_spectrum, size,
+                           slice(radius, radius + self.shape[0]))
+        heat = heat[:, radius:radius + self.shape[1]]
+
+        return weather_factor(wind_strength, humidity, temperature) * heat[self.rows, self.cols]
@@ -0,0 +1,53 @@
+import threading
+from collections import OrderedDict
+
+
+class ResultsCache:
+
+    def __init__(self, max_runs=4):
+        """
+        Server-side cache of simulation results keyed by run id, evicting the least recently used run.
+        Entries are ResultsReader of the results stores, read one step at a time with `get_column`.
+
+        :param max_runs: Number of runs kept.
+        """
+        self.max_runs = max_runs
+        self.runs = OrderedDict()
+        self.lock = threading.Lock()
+
+    def __contains__(self, run_id):
+        return run_id in self.runs
+
+    def put(self, run_id, results):
+        with self.lock:
+            self.runs[run_id] = results
+            self.runs.move_to_end(run_id)
+            while len(self.runs) > self.max_runs:
+                self.runs.popitem(last=False)
+
+    def get(self, run_id):
+        """
+        :param run_id: Id of the run.
+        :return: ResultsReader, or None if the run is not cached.
+        """
+        with self.lock:
+            results = self.runs.get(run_id)
+            if results is not None:
+                self.runs.move_to_end(run_id)
+
+            return results
+
+    def get_column(self, run_id, name, step_count):
+        """
+        One column of one step of a cached run.
+
+        :return: Array with the value of every tree, or None if the run or the step are not cached.
+        """
+        results = self.get(run_id)
+        if results is None:
+            return None
+
+        try:
+            return results.get_column(name, step_count)
+        except KeyError:
+            return None
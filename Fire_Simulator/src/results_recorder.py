@@ -0,0 +1,78 @@
+import numpy as np
+import pandas as pd
+from src.tree_model import COLORS, UNBURNED, ON_FIRE, BURNED
+
+
+def state_codes(state):
+    """
+    Single state code (UNBURNED, ON_FIRE or BURNED) for every tree from its state arrays.
+
+    :param state: Dictionary of state arrays as returned by `ForestModel.get_state`.
+    :return: int8 array of state codes.
+    """
+    return np.where(state["is_burned"], BURNED, np.where(state["on_fire"], ON_FIRE, UNBURNED)).astype(np.int8)
+
+
+class ResultsRecorder:
+
+    def __init__(self, lon, lat, n_steps):
+        """
+        Records the state of every tree at every step into preallocated typed columns.
+
+        :param lon: Longitude of every tree, in the model order.
+        :param lat: Latitude of every tree, in the model order.
+        :param n_steps: Number of snapshots that will be recorded.
+        """
+        self.lon = np.asarray(lon, dtype=float)
+        self.lat = np.asarray(lat, dtype=float)
+        self.n_agents = len(self.lon)
+        self.n_steps = n_steps
+        self.n_recorded = 0
+
+        size = self.n_agents * n_steps
+        self.agent_id = np.tile(np.arange(self.n_agents, dtype=np.int64), n_steps)
+        self.step_count = np.empty(size, dtype=np.int32)
+        self.x = np.empty(size, dtype=float)
+        self.y = np.empty(size, dtype=float)
+        self.state = np.empty(size, dtype=np.int8)
+        self.burning_value = np.empty(size, dtype=float)
+        self.color = np.empty(size, dtype=np.int8)
+
+    def record(self, step_count, state):
+        """
+        Copy one snapshot into the next block of rows.
+
+        :param step_count: Step of the snapshot.
+        :param state: Dictionary of state arrays as returned by `ForestModel.get_state`.
+        """
+        if self.n_recorded >= self.n_steps:
+            raise IndexError(f"The recorder was allocated for {self.n_steps} steps")
+
+        rows = slice(self.n_recorded * self.n_agents, (self.n_recorded + 1) * self.n_agents)
+        self.step_count[rows] = step_count
+        self.x[rows] = self.lon
+        self.y[rows] = self.lat
+        self.state[rows] = state_codes(state)
+        self.burning_value[rows] = state["burning_value"]
+        self.color[rows] = state["color"]
+        self.n_recorded += 1
+
+    def to_frame(self):
+        """
+        Compact DataFrame of the recorded snapshots.
+
+        `agent_id` is the position of the tree in the model (`ForestModel.tree_agents` order), `x` and
+        `y` are longitude and latitude, `state` is one of UNBURNED, ON_FIRE, BURNED and `color` is a
+        categorical whose codes index `COLORS`.
+
+        :return: DataFrame with one row per tree and recorded step.
+        """
+        rows = slice(0, self.n_recorded * self.n_agents)
+        return pd.DataFrame({"agent_id": self.agent_id[rows],
+                             "step_count": self.step_count[rows],
+                             "x": self.x[rows],
+                             "y": self.y[rows],
+                             "state": self.state[rows],
+                             "burning_value": self.burning_value[rows],
+                             "color": pd.Categorical.from_codes(self.color[rows], categories=COLORS)},
+                            copy=False)
@@ -0,0 +1,158 @@
+import json
+import os
+import numpy as np
+import pandas as pd
+from src.atomic_file import atomic_path
+from src.results_recorder import state_codes
+from src.tree_model import COLORS
+
+# Columns stored per step, with their dtypes
+STEP_COLUMNS = {"state": np.int8, "burning_value": float, "color": np.int8}
+
+
+def _write_meta(path, meta):
+    with atomic_path(os.path.join(path, "meta.json")) as temporary:
+        with open(temporary, "w") as file:
+            json.dump(meta, file)
+
+
+class ResultsWriter:
+
+    def __init__(self, path, lon, lat, n_steps):
+        """
+        Records the state of every tree at every step into a directory of memory-mapped NumPy files:
+        x.npy and y.npy with the coordinates of the trees and one (steps x trees) file per column in
+        STEP_COLUMNS, with the recorded steps listed in meta.json. Only the step being written is in
+        memory, and every step can be read back on its own with a ResultsReader, also while the run is
+        still being written.
+
+        :param path: Directory of the results (created if needed).
+        :param lon: Longitude of every tree, in the model order.
+        :param lat: Latitude of every tree, in the model order.
+        :param n_steps: Maximum number of snapshots that will be recorded.
+        """
+        self.path = path
+        self.n_agents = len(lon)
+        self.n_steps = n_steps
+        self.step_counts = []
+
+        os.makedirs(path, exist_ok=True)
+        np.save(os.path.join(path, "x.npy"), np.asarray(lon, dtype=float))
+        np.save(os.path.join(path, "y.npy"), np.asarray(lat, dtype=float))
+        self.columns = {name: np.lib.format.open_memmap(os.path.join(path, f"{name}.npy"), mode="w+", dtype=dtype,
+                                                        shape=(n_steps, self.n_agents))
+                        for name, dtype in STEP_COLUMNS.items()}
+        self.write_meta(complete=False)
+
+    def write_meta(self, complete):
+        _write_meta(self.path, {"n_agents": self.n_agents,
+                                "n_steps": self.n_steps,
+                                "step_counts": self.step_counts,
+                                "complete": complete})
+
+    def record(self, step_count, state):
+        """
+        Write one snapshot into the next row of every column.
+
+        :param step_count: Step of the snapshot.
+        :param state: Dictionary of state arrays as returned by `ForestModel.get_state`.
+        """
+        row = len(self.step_counts)
+        if row >= self.n_steps:
+            raise IndexError(f"The results were allocated for {self.n_steps} steps")
+
+        self.columns["state"][row] = state_codes(state)
+        self.columns["burning_value"][row] = state["burning_value"]
+        self.columns["color"][row] = state["color"]
+        for values in self.columns.values():
+            values.flush()
+
+        self.step_counts.append(int(step_count))
+        self.write_meta(complete=False)
+
+    def close(self):
+        """
+        Mark the results as complete and release the files.
+        """
+        self.write_meta(complete=True)
+        self.columns = {}
+
+    def reader(self):
+        return ResultsReader(self.path)
+
+
+class ResultsReader:
+
+    def __init__(self, path):
+        """
+        Reads the results written by a ResultsWriter one step at a time, through memory maps, so a run
+        never needs to fit in memory.
+
+        :param path: Directory of the results.
+        """
+        self.path = path
+        self.x = np.load(os.path.join(path, "x.npy"), mmap_mode="r")
+        self.y = np.load(os.path.join(path, "y.npy"), mmap_mode="r")
+        self.columns = {name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r") for name in STEP_COLUMNS}
+        self.refresh()
+
+    def __len__(self):
+        return len(self.step_counts)
+
+    def refresh(self):
+        """
+        Read again the list of recorded steps, to follow a run that is still being written.
+        """
+        with open(os.path.join(self.path, "meta.json")) as file:
+            meta = json.load(file)
+
+        self.n_agents = meta["n_agents"]
+        self.complete = meta["complete"]
+        self.step_counts = np.asarray(meta["step_counts"], dtype=np.int64)
+
+    def row(self, step_count):
+        rows = np.flatnonzero(self.step_counts == step_count)
+        if len(rows) == 0:
+            raise KeyError(f"Step {step_count} was not recorded")
+
+        return rows[0]
+
+    def get_column(self, name, step_count):
+        """
+        One column of one step.
+
+        :param name: Column in STEP_COLUMNS.
+        :param step_count: Recorded step.
+        :return: Array with the value of every tree.
+        """
+        return np.asarray(self.columns[name][self.row(step_count)])
+
+    def get_step(self, step_count):
+        """
+        Results of one step, reading only that step from disk.
+
+        :param step_count: Recorded step.
+        :return: DataFrame with the same columns as `ResultsRecorder.to_frame`.
+        """
+        row = self.row(step_count)
+        return pd.DataFrame({"agent_id": np.arange(self.n_agents, dtype=np.int64),
+                             "step_count": np.full(self.n_agents, step_count, dtype=np.int32),
+                             "x": np.asarray(self.x),
+                             "y": np.asarray(self.y),
+                             "state": np.asarray(self.columns["state"][row]),
+                             "burning_value": np.asarray(self.columns["burning_value"][row]),
+                             "color": pd.Categorical.from_codes(self.columns["color"][row], categories=COLORS)})
+
+    def to_frame(self):
+        """
+        Results of every recorded step in one DataFrame, for runs that fit in memory.
+
+        :return: DataFrame with the same columns as `ResultsRecorder.to_frame`.
+        """
+        if len(self) == 0:
+            return pd.DataFrame({"agent_id": np.empty(0, dtype=np.int64), "step_count": np.empty(0, dtype=np.int32),
+                                 "x": np.empty(0), "y": np.empty(0), "state": np.empty(0, dtype=np.int8),
+                                 "burning_value": np.empty(0),
+                                 "color": pd.Categorical.from_codes([], categories=COLORS)})
+
+        return pd.concat([self.get_step(step_count) for step_count in self.step_counts], ignore_index=True)
@@ -0,0 +1,219 @@
+import fcntl
+import hashlib
+import json
+import os
+import shutil
+import numpy as np
+import shapely
+from shapely.geometry.base import BaseGeometry
+from src.results_store import ResultsReader
+from src.weather import WeatherSchedule, WEATHER_COLUMNS
+
+# Version of the simulated results, part of the scenario key so that results of an older model are
+# not served: increase it with any change of the heat or ignition model or of the stored results
+SCENARIO_VERSION = 1
+
+
+def _canonical(value):
+    """
+    JSON-serialisable form of a scenario input that is the same for equal inputs: polygons in their
+    normalized form (same rings whatever vertex they start at or their orientation), whole numbers
+    as integers (a humidity of 60 is the same as 60.0) and dictionaries with sorted keys.
+    """
+    if isinstance(value, BaseGeometry):
+        return shapely.to_wkb(shapely.normalize(value), hex=True)
+    if isinstance(value, WeatherSchedule):
+        return {"hours": value.hours.tolist(), "hours_per_step": float(value.hours_per_step),
+                **{column: getattr(value, column).tolist() for column in WEATHER_COLUMNS}}
+    if isinstance(value, dict):
+        return {str(key): _canonical(item) for key, item in sorted(value.items())}
+    if isinstance(value, (list, tuple, np.ndarray)):
+        return [_canonical(item) for item in value]
+    if isinstance(value, (bool, np.bool_)):
+        return bool(value)
+    if isinstance(value, (int, np.integer)):
+        return int(value)
+    if isinstance(value, (float, np.floating)):
+        return int(value) if float(value).is_integer() else float(value)
+
+    return value
+
+
+def scenario_key(parameters, fire_areas, simulation_time, seed):
+    """
+    Hash identifying the results of a scenario, used as the name of its cache directory.
+
+    :param parameters: Keyword arguments of ForestModel (areas with their vegetation, weather,
+        trees_per_agent, engine...).
+    :param fire_areas: List of dictionaries with the name and the area of the fires.
+    :param simulation_time: Number of steps.
+    :param seed: Seed of the model.
+    :return: Hexadecimal string.
+    """
+    if seed is None:
+        raise ValueError("Only seeded scenarios can be cached")
+
+    scenario = _canonical({"parameters": parameters,
+                           "fire_areas": fire_areas,
+                           "simulation_time": simulation_time,
+                           "seed": seed,
+                           "version": SCENARIO_VERSION})
+
+    return hashlib.sha1(json.dumps(scenario, sort_keys=True).encode()).hexdigest()
+
+
+def _size(path):
+    return sum(entry.stat().st_size for entry in os.scandir(path) if entry.is_file())
+
+
+def _is_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _read_json(path):
+    try:
+        with open(path) as file:
+            return json.load(file)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def _is_complete(path):
+    meta = _read_json(os.path.join(path, "meta.json"))
+    return meta is not None and meta["complete"]
+
+
+class ScenarioCache:
+
+    def __init__(self, cache_dir, max_bytes=2 * 1024 ** 3):
+        """
+        Results of simulated scenarios on disk, one results store per scenario key. The least recently
+        used results are removed once the cache is larger than `max_bytes`. The directory can be shared
+        by several processes, and the recency of an entry is the modification time of its directory so
+        it survives restarts.
+
+        :param cache_dir: Directory of the cache (created if needed).
+        :param max_bytes: Maximum size of the complete results in the cache.
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def path(self, key):
+        return os.path.join(self.cache_dir, key)
+
+    def get(self, key):
+        """
+        :param key: Scenario key.
+        :return: ResultsReader of the complete results of the scenario, or None if they are not cached.
+        """
+        path = self.path(key)
+        if not _is_complete(path):
+            return None
+
+        os.utime(path)
+        return ResultsReader(path)
+
+    def remove(self, key):
+        shutil.rmtree(self.path(key), ignore_errors=True)
+
+    def lock_path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.lock")
+
+    def claim(self, key, n_steps):
+        """
+        Take the lock of a scenario before simulating it, so that processes sharing the cache never
+        write or remove the results another one is writing. A lock whose process is gone is taken over
+        (the processes sharing the cache are expected to run on the same host).
+
+        The lock file is written in full under a temporary name and then linked in place, so it is
+        never seen half written. A stale lock is replaced while holding an exclusive `flock` on it:
+        processes waiting for the same stale lock find it replaced once they get the `flock`, and
+        check the new owner instead of taking it over again.
+
+        :param key: Scenario key.
+        :param n_steps: Number of steps the results will have, reported by `lock_owner`.
+        :return: Whether this process got the lock.
+        """
+        path = self.lock_path(key)
+        temporary = f"{path}.{os.getpid()}.tmp"
+        with open(temporary, "w") as file:
+            json.dump({"pid": os.getpid(), "n_steps": n_steps}, file)
+
+        try:
+            while True:
+                try:
+                    os.link(temporary, path)
+                    return True
+                except FileExistsError:
+                    pass
+
+                try:
+                    file = open(path)
+                except FileNotFoundError:
+                    continue
+                with file:
+                    fcntl.flock(file, fcntl.LOCK_EX)
+
+                    # The lock was released or taken over while waiting for the flock
+                    try:
+                        if os.stat(path).st_ino != os.fstat(file.fileno()).st_ino:
+                            continue
+                    except FileNotFoundError:
+                        continue
+
+                    try:
+                        owner = json.load(file)
+                    except ValueError:
+                        owner = None
+                    if owner is not None and _is_alive(owner["pid"]):
+                        return False
+
+                    os.replace(temporary, path)
+                    return True
+        finally:
+            try:
+                os.remove(temporary)
+            except FileNotFoundError:
+                pass
+
+    def lock_owner(self, key):
+        """
+        :param key: Scenario key.
+        :return: Dictionary with the pid of the process simulating the scenario and its number of
+            steps, or None if the scenario is not locked by a running process.
+        """
+        owner = _read_json(self.lock_path(key))
+        if owner is None or not _is_alive(owner["pid"]):
+            return None
+
+        return owner
+
+    def release(self, key):
+        try:
+            os.remove(self.lock_path(key))
+        except FileNotFoundError:
+            pass
+
+    def evict(self):
+        """
+        Remove the least recently used complete results until the cache fits in `max_bytes`. Results
+        still being written are never removed.
+        """
+        entries = []
+        for entry in os.scandir(self.cache_dir):
+            if entry.is_dir() and _is_complete(entry.path):
+                entries.append((entry.stat().st_mtime, _size(entry.path), entry.name))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, key in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            self.remove(key)
+            total -= size
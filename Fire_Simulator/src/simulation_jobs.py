@@ -0,0 +1,123 @@
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from src.results_store import ResultsReader
+from src.scenario_cache import scenario_key
+
+
+def run_job(parameters, fire_areas, simulation_time, results_path, seed=None):
+    """
+    Run one simulation in a worker process, writing every step to a results store.
+
+    :param parameters: Keyword arguments of ForestModel.
+    :param fire_areas: List of dictionaries with the name and the area of the fires.
+    :param simulation_time: Number of steps.
+    :param results_path: Directory of the results.
+    :param seed: Seed of the model.
+    :return: Number of recorded steps.
+    """
+    # Imported here so the worker processes load the model, not the app
+    from src.forest_model import ForestModel
+
+    model = ForestModel(seed=seed, **parameters)
+    model.initialise_fire(fire_areas)
+    return len(model.run_simulation(simulation_time=simulation_time, record="store", results_path=results_path))
+
+
+class SimulationJobs:
+
+    def __init__(self, cache, max_workers=None):
+        """
+        Runs simulations in a pool of background processes, so the caller is never blocked by a run.
+        Every run writes its steps to its entry of the scenario cache, which can be read step by step
+        while the run is in progress, and a scenario whose results are cached is not simulated again.
+        Runs take the lock of their scenario in the cache, so several processes can share it.
+
+        :param cache: ScenarioCache the results are written to.
+        :param max_workers: Number of simulations that run at the same time (number of CPUs by default).
+        """
+        self.cache = cache
+        self.executor = ProcessPoolExecutor(max_workers=max_workers)
+        self.jobs = {}
+        self.lock = threading.Lock()
+
+    def submit(self, parameters, fire_areas, simulation_time, seed):
+        """
+        Start a simulation in the background, unless the same scenario is cached or already running
+        here or in another process sharing the cache.
+
+        :param parameters: Keyword arguments of ForestModel.
+        :param fire_areas: List of dictionaries with the name and the area of the fires.
+        :param simulation_time: Number of steps.
+        :param seed: Seed of the model.
+        :return: Id of the run, the key of the scenario.
+        """
+        run_id = scenario_key(parameters, fire_areas, simulation_time, seed)
+
+        with self.lock:
+            job = self.jobs.get(run_id)
+            if (job is not None and not job["future"].done()) or self.cache.get(run_id) is not None:
+                return run_id
+            if not self.cache.claim(run_id, n_steps=simulation_time + 1):
+                return run_id
+
+            # Results left by a failed or interrupted run, only removed once this process holds the lock
+            self.cache.remove(run_id)
+
+            future = self.executor.submit(run_job, parameters, fire_areas, simulation_time,
+                                          self.cache.path(run_id), seed)
+            future.add_done_callback(lambda _: self.cache.release(run_id))
+            self.jobs[run_id] = {"future": future, "n_steps": simulation_time + 1}
+
+            # Finished runs are found in the cache from now on, failed runs are kept to report the error
+            for key in [key for key, job in self.jobs.items() if job["future"].done() and
+                        job["future"].exception() is None]:
+                del self.jobs[key]
+            self.cache.evict()
+
+        return run_id
+
+    def status(self, run_id):
+        """
+        State of a run.
+
+        :param run_id: Id of the run.
+        :return: Dictionary with the state ("unknown", "running", "done" or "failed"), the number of
+            steps the run was started for (None for cached runs) and the error of a failed run. Runs
+            of other processes sharing the cache are "running" while they hold the lock.
+        """
+        with self.lock:
+            job = self.jobs.get(run_id)
+        if job is None:
+            if self.cache.get(run_id) is not None:
+                return {"state": "done", "n_steps": None, "error": None}
+
+            # Run by another process sharing the cache
+            owner = self.cache.lock_owner(run_id)
+            if owner is not None:
+                return {"state": "running", "n_steps": owner["n_steps"], "error": None}
+            return {"state": "unknown", "n_steps": None, "error": None}
+
+        future = job["future"]
+        if not future.done():
+            return {"state": "running", "n_steps": job["n_steps"], "error": None}
+
+        error = future.exception()
+        return {"state": "failed" if error else "done", "n_steps": job["n_steps"],
+                "error": repr(error) if error else None}
+
+    def reader(self, run_id):
+        """
+        :param run_id: Id of the run.
+        :return: ResultsReader of the steps recorded so far (call `refresh` to follow the run), or None
+            if the run has not started writing.
+        """
+        # The metadata is written once every results file exists
+        path = self.cache.path(run_id)
+        if not os.path.exists(os.path.join(path, "meta.json")):
+            return None
+
+        return ResultsReader(path)
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,52 @@
+import math
+import numpy as np
+import shapely
+from shapely import STRtree
+
+# Lower bound of the length of one degree of latitude in metres, used to turn metric radii into degrees
+METRES_PER_DEGREE = 110000
+
+
+def radius_in_degrees(radius, latitude):
+    """
+    Conservative search radius in degrees for a radius in meters: a degree of longitude shrinks with
+    cos(latitude), so the radius is divided by the shortest degree length at that latitude.
+
+    :param radius: Radius in meters.
+    :param latitude: Largest absolute latitude of the search centres.
+    :return: Radius in degrees.
+    """
+    return radius / (METRES_PER_DEGREE * max(math.cos(math.radians(latitude)), 1e-6))
+
+
+class BurningIndex:
+
+    def __init__(self, ids, lon, lat):
+        """
+        Spatial index (STRtree) over the trees that are on fire at the moment it is built.
+
+        :param ids: Array with the positions of the burning trees in the model, in schedule order.
+        :param lon: Longitude of the burning trees.
+        :param lat: Latitude of the burning trees.
+        """
+        self.ids = np.asarray(ids, dtype=np.int64)
+        self.tree = STRtree(shapely.points(lon, lat))
+
+    def __len__(self):
+        return len(self.ids)
+
+    def query(self, location, radius):
+        """
+        Return the indexed trees within `radius` metres of `location`, in schedule order.
+
+        :param location: Shapely Point (lon, lat) to search around.
+        :param radius: Search radius in metres.
+        :return: Array of positions in the model.
+        """
+        if not len(self.ids):
+            return self.ids
+
+        indices = np.sort(self.tree.query(location, predicate="dwithin",
+                                          distance=radius_in_degrees(radius, abs(location.y))))
+
+        return self.ids[indices]
@@ -0,0 +1,158 @@
+import numpy as np
+import pandas as pd
+from src.results_recorder import ResultsRecorder, state_codes
+from src.tree_model import COLORS, UNBURNED, ON_FIRE, BURNED
+
+# Transitions logged between two consecutive steps, prefixed so they are not mixed up with the codes
+# of src.events
+TRANSITIONS = np.array(["ignited", "phase_change", "burned"])
+TRANSITION_IGNITED, TRANSITION_PHASE_CHANGE, TRANSITION_BURNED = range(len(TRANSITIONS))
+
+# Columns of the logged transitions
+EVENT_DTYPES = {"step_count": np.int32, "agent_id": np.int64, "transition": np.int8,
+                "state": np.int8, "burning_value": float, "color": np.int8}
+
+
+class TransitionLog:
+
+    def __init__(self, lon, lat):
+        """
+        Records the first snapshot of the trees and then only the trees whose state, burning value or
+        color changed at each step, so its size scales with the fire activity instead of with the number
+        of trees times the number of steps.
+
+        :param lon: Longitude of every tree, in the model order.
+        :param lat: Latitude of every tree, in the model order.
+        """
+        self.lon = np.asarray(lon, dtype=float)
+        self.lat = np.asarray(lat, dtype=float)
+        self.n_agents = len(self.lon)
+        self.first_step = None
+        self.last_step = None
+        self.initial = None
+        self.current = None
+        self.chunks = []
+
+    def __len__(self):
+        return sum(len(chunk["agent_id"]) for chunk in self.chunks)
+
+    def record(self, step_count, state):
+        """
+        Log the transitions from the previously recorded step (the first call stores the full state).
+
+        :param step_count: Step of the snapshot, consecutive to the previous one.
+        :param state: Dictionary of state arrays as returned by `ForestModel.get_state`.
+        """
+        snapshot = {"state": state_codes(state),
+                    "burning_value": np.array(state["burning_value"], dtype=float),
+                    "color": np.array(state["color"], dtype=np.int8)}
+
+        if self.initial is None:
+            self.first_step = self.last_step = step_count
+            self.initial = snapshot
+            self.current = {key: values.copy() for key, values in snapshot.items()}
+            return
+
+        changed = np.flatnonzero((snapshot["state"] != self.current["state"]) |
+                                 (snapshot["burning_value"] != self.current["burning_value"]) |
+                                 (snapshot["color"] != self.current["color"]))
+
+        if len(changed):
+            previous, new = self.current["state"][changed], snapshot["state"][changed]
+            transition = np.where((previous == UNBURNED) & (new == ON_FIRE), TRANSITION_IGNITED,
+                                  np.where((previous != BURNED) & (new == BURNED), TRANSITION_BURNED,
+                                           TRANSITION_PHASE_CHANGE))
+
+            self.chunks.append({"step_count": np.full(len(changed), step_count, dtype=np.int32),
+                                "agent_id": changed.astype(np.int64),
+                                "transition": transition.astype(np.int8),
+                                "state": new,
+                                "burning_value": snapshot["burning_value"][changed],
+                                "color": snapshot["color"][changed]})
+
+            for key, values in snapshot.items():
+                self.current[key][changed] = values[changed]
+
+        self.last_step = step_count
+
+    def events(self):
+        """
+        All the logged transitions, in step order.
+
+        :return: Dictionary of arrays with step_count, agent_id, transition, state, burning_value and color.
+        """
+        if not self.chunks:
+            return {key: np.empty(0, dtype=dtype) for key, dtype in EVENT_DTYPES.items()}
+
+        # Merge the per-step chunks once so that repeated seeks do not concatenate them again
+        if len(self.chunks) > 1:
+            self.chunks = [{key: np.concatenate([chunk[key] for chunk in self.chunks]) for key in EVENT_DTYPES}]
+
+        return self.chunks[0]
+
+    def to_frame(self):
+        """
+        Transitions as a DataFrame, one row per tree that changed at a given step.
+
+        :return: DataFrame with step_count, agent_id, transition, state, burning_value and color columns.
+        """
+        events = self.events()
+        return pd.DataFrame({"step_count": events["step_count"],
+                             "agent_id": events["agent_id"],
+                             "transition": pd.Categorical.from_codes(events["transition"], categories=TRANSITIONS),
+                             "state": events["state"],
+                             "burning_value": events["burning_value"],
+                             "color": pd.Categorical.from_codes(events["color"], categories=COLORS)})
+
+    def state_at(self, step_count):
+        """
+        Rebuild the state of every tree at `step_count` by replaying the transitions up to it.
+
+        :param step_count: Step between the first and the last recorded ones.
+        :return: DataFrame with the same columns as `ResultsRecorder.to_frame` for that step.
+        """
+        if self.initial is None or not self.first_step <= step_count <= self.last_step:
+            raise ValueError(f"Step {step_count} was not recorded ({self.first_step} to {self.last_step})")
+
+        snapshot = {key: values.copy() for key, values in self.initial.items()}
+        events = self.events()
+        n_events = np.searchsorted(events["step_count"], step_count, side="right")
+
+        # Keep only the last transition of every tree up to the step
+        agent_id = events["agent_id"][:n_events][::-1]
+        agent_id, last = np.unique(agent_id, return_index=True)
+        last = n_events - 1 - last
+        for key in snapshot:
+            snapshot[key][agent_id] = events[key][last]
+
+        recorder = ResultsRecorder(lon=self.lon, lat=self.lat, n_steps=1)
+        recorder.record(step_count, self._as_state(snapshot))
+
+        return recorder.to_frame()
+
+    def to_snapshots(self):
+        """
+        Replay the transitions into full snapshots of every recorded step.
+
+        :return: DataFrame with the same columns as `ResultsRecorder.to_frame`.
+        """
+        events = self.events()
+        steps = range(self.first_step, self.last_step + 1)
+        bounds = np.searchsorted(events["step_count"], np.arange(self.first_step, self.last_step + 2))
+
+        recorder = ResultsRecorder(lon=self.lon, lat=self.lat, n_steps=len(steps))
+        snapshot = {key: values.copy() for key, values in self.initial.items()}
+        for ii, step_count in enumerate(steps):
+            rows = slice(bounds[ii], bounds[ii + 1])
+            for key in snapshot:
+                snapshot[key][events["agent_id"][rows]] = events[key][rows]
+            recorder.record(step_count, self._as_state(snapshot))
+
+        return recorder.to_frame()
+
+    @staticmethod
+    def _as_state(snapshot):
+        return {"on_fire": snapshot["state"] == ON_FIRE,
+                "is_burned": snapshot["state"] == BURNED,
+                "burning_value": snapshot["burning_value"],
+                "color": snapshot["color"]}
@@ -1,68 +1,249 @@
 from mesa import Agent
 import math
-import random
-from geopy.distance import geodesic
+import numpy as np
 from shapely.geometry import Point
 from pyproj import Transformer
+from src.events import IGNITED, BURNING, BURNED_OUT
 
+# Heat model constants
+BASE_INTENSITY = 10000  # Base intensity in W/m^2 (arbitrary unit for initial fire strength)
+DISTANCE_DECAY = 50  # Distance (m) over which the heat intensity decays by a factor e
+NEGLIGIBLE_INTENSITY = 1e-3  # Contributions below this intensity are ignored by the spatial lookup
+IGNITION_INTENSITY = 30  # Total intensity below which a tree cannot catch fire
 
-class Tree(Agent):
+# Colors of the trees, stored as codes in the state arrays and results
+COLORS = np.array(["green", "orange", "red", "black"])
+GREEN, ORANGE, RED, BLACK = range(len(COLORS))
+COLOR_CODES = {color: code for code, color in enumerate(COLORS)}
 
-    def __init__(self, unique_id, location, trees_properties, model):
+# States of the trees in the results
+UNBURNED, ON_FIRE, BURNED = range(3)
 
-        super().__init__(unique_id, model)
 
-        # Set tree properties
-        self.location = location
-        self.on_fire = False
-        self.is_burned = False
-        self.time_lasting_on_fire = 5
-        self.time_left_on_fire = 0
-        self.current_time_to_fire = 0
-        self.current_time_on_fire = 0
-        self.step_count = model.step_count
-        self.color = "green"
-        self.burning_value = 0.01
+def weather_factor(wind_strength, humidity=50, temperature=20):
+    """
+    Part of the heat intensity that only depends on the weather, the same for every pair of trees.
 
-    @staticmethod
-    def calculate_heat_intensity(source, target, wind_strength, wind_direction):
+    :param wind_strength: Wind speed.
+    :param humidity: Relative humidity in percent.
+    :param temperature: Temperature in degrees Celsius.
+    :return: Factor multiplying the distance and angular terms.
+    """
+    humidity_factor = 1 - (humidity / 100)  # Fire intensity decreases with higher humidity
+    temperature_factor = 1 + (temperature - 20) / 100  # 20°C as baseline
+    wind_factor = 1 + (wind_strength / 10)  # Wind increases the spread and intensity of fire
+
+    return BASE_INTENSITY * humidity_factor * temperature_factor * wind_factor
+
+
+def angular_influence(angle_to_target, wind_direction):
+    """
+    Angular term of the heat intensity, higher when the burning tree is in the wind direction.
+
+    :param angle_to_target: Array of directions (degrees) from the heated tree to the burning tree.
+    :param wind_direction: Wind direction in degrees.
+    :return: Array of weights between 0 and 1.
+    """
+    angle_diff = np.mod(wind_direction - angle_to_target + 360, 360)
+    angle_diff = np.minimum(angle_diff, 360 - angle_diff)
+
+    return np.maximum(0, np.cos(np.radians(angle_diff)))
+
+
+def heat_intensity(distance, angle_to_target, wind_strength, wind_direction, humidity=50, temperature=20):
+    """
+    Heat intensity a tree gets from burning trees, from precomputed distances and directions.
+
+    :param distance: Array of distances between the trees in meters.
+    :param angle_to_target: Array of directions (degrees) from the heated tree to the burning tree.
+    :param wind_strength: Wind speed.
+    :param wind_direction: Wind direction in degrees.
+    :param humidity: Relative humidity in percent.
+    :param temperature: Temperature in degrees Celsius.
+    :return: Array of heat intensities.
+    """
+    distance_factor = np.exp(-distance / DISTANCE_DECAY)
+
+    return (weather_factor(wind_strength, humidity, temperature) *
+            distance_factor * angular_influence(angle_to_target, wind_direction))
+
+
+def ignition_probability(intensity):
+    """
+    Probability of a tree catching fire given the total heat intensity it receives (array version
+    of the thresholds in `Tree.step`).
+
+    :param intensity: Array of summed heat intensities.
+    :return: Array of probabilities.
+    """
+    intensity = np.asarray(intensity, dtype=float)
+    return np.where(intensity < IGNITION_INTENSITY, 0,
+                    np.where(intensity < 12000, 0.8 * intensity / 12000, 0.9))
+
+
+def burn_out_step(state, time_lasting_on_fire):
+    """
+    Array version of `Tree.step` for a step in which no tree can catch fire: the trees on fire burn one
+    more step and burn out once they have burned `time_lasting_on_fire` steps, and the burned trees
+    stop smouldering. The state is updated in place.
+
+    :param state: Dictionary with on_fire, is_burned, current_time_on_fire, burning_value and color arrays.
+    :param time_lasting_on_fire: Number of steps a tree burns (a scalar or one value per tree).
+    :return: Tuple with the boolean arrays of the trees that were burning and of those that burned out.
+    """
+    burning = state["on_fire"].copy()
+    state["burning_value"][state["is_burned"]] = 1
+
+    time_on_fire = state["current_time_on_fire"][burning] + 1
+    state["current_time_on_fire"][burning] = time_on_fire
+    state["burning_value"][burning] = 0.1
+    state["color"][burning] = np.where(time_on_fire < 2, ORANGE, RED)
+
+    burned_out = burning & (state["current_time_on_fire"] >= time_lasting_on_fire)
+    state["on_fire"][burned_out] = False
+    state["is_burned"][burned_out] = True
+    state["color"][burned_out] = BLACK
+
+    return burning, burned_out
+
+
+class TreeColumns:
 
-        s = (source.y, source.x)
-        t = (target.y, target.x)
+    def __init__(self, lon, lat, easting, northing, step_count=0):
+        """
+        Properties of the Tree agents of a model in shared arrays, one element per tree in the model
+        order. The agents are views on their element, so the trees cost a few arrays instead of one
+        object with its own attributes per tree.
 
-        # Calculate the geodesic distance between the two points
-        distance = geodesic(s, t).meters
+        :param lon: Longitude of the trees.
+        :param lat: Latitude of the trees.
+        :param easting: Projected x coordinates in meters (model.projection).
+        :param northing: Projected y coordinates in meters (model.projection).
+        :param step_count: Step of the model when the trees are created.
+        """
+        n = len(lon)
+        self.lon = np.asarray(lon, dtype=float)
+        self.lat = np.asarray(lat, dtype=float)
+        self.easting = np.asarray(easting, dtype=float)
+        self.northing = np.asarray(northing, dtype=float)
+        self.on_fire = np.zeros(n, dtype=bool)
+        self.is_burned = np.zeros(n, dtype=bool)
+        self.time_lasting_on_fire = np.full(n, 5, dtype=np.int32)
+        self.time_left_on_fire = np.zeros(n, dtype=np.int32)
+        self.current_time_to_fire = np.zeros(n, dtype=np.int32)
+        self.current_time_on_fire = np.zeros(n, dtype=np.int32)
+        self.step_count = np.full(n, step_count, dtype=np.int64)
+        self.color = np.full(n, GREEN, dtype=np.int8)
+        self.burning_value = np.full(n, 0.01)
 
-        # Calculate direction from source to target
-        dx = target.x - source.x
-        dy = target.y - source.y
-        angle_to_target = math.degrees(math.atan2(dy, dx))
+    def __len__(self):
+        return len(self.lon)
 
-        # Calculate the angular difference between wind direction and direction to target
-        angle_diff = (wind_direction - angle_to_target + 360) % 360
-        angle_diff = min(angle_diff, 360 - angle_diff)
 
-        # Constants
-        base_intensity = 10000  # Base intensity in W/m^2 (arbitrary unit for initial fire strength)
-        humidity_factor = 1 - (50 / 100)  # Fire intensity decreases with higher humidity
-        temperature_factor = 1 + (20 - 20) / 100  # Adjust intensity based on temperature (20°C as baseline)
-        wind_factor = 1 + (wind_strength / 10)  # Wind increases the spread and intensity of fire
-        distance_factor = math.exp(-distance/50)  # Heat intensity decreases exponentially with distance
+def _column(name):
 
-        # Angular influence (higher intensity in wind direction)
-        angular_influence = max(0, math.cos(math.radians(angle_diff)))
+    # Attribute of a Tree stored in its element of a TreeColumns array, read as a Python scalar
+    def get(self):
+        return getattr(self.columns, name).item(self.unique_id)
 
-        # Area size influence (larger areas on fire will have a more significant impact)
-        # area_factor = math.sqrt(area_size / 1000)
+    def set(self, value):
+        getattr(self.columns, name)[self.unique_id] = value
 
-        # Calculate the final heat intensity
-        heat_intensity = (base_intensity * humidity_factor * temperature_factor * wind_factor *
-                          distance_factor * angular_influence)
+    return property(get, set)
 
-        return heat_intensity
+
+class TreeAgents:
+
+    def __init__(self, columns, model):
+        """
+        Sequence of the Tree agents of a model, in the model order. The agents are views created when
+        they are accessed, so a forest costs its TreeColumns and no object per tree.
+
+        :param columns: TreeColumns with the properties of every tree.
+        :param model: ForestModel the trees belong to.
+        """
+        self.columns = columns
+        self.model = model
+
+    def __len__(self):
+        return len(self.columns)
+
+    def __getitem__(self, unique_id):
+
+        # Indexing a range checks the bounds and resolves negative positions
+        return Tree(unique_id=range(len(self.columns.lon))[unique_id], columns=self.columns, model=self.model)
+
+    def __iter__(self):
+        for unique_id in range(len(self)):
+            yield Tree(unique_id=unique_id, columns=self.columns, model=self.model)
+
+
+class Tree(Agent):
+
+    def __init__(self, unique_id, columns, model):
+        """
+        Tree agent whose properties live in the shared TreeColumns of the model. Trees are views on
+        their element of the columns, created on demand, so they are not registered in the agents of
+        the Mesa model: two views of the same tree share all their properties.
+
+        :param unique_id: Sequential id of the tree, also its position in `columns`.
+        :param columns: TreeColumns with the properties of every tree.
+        :param model: ForestModel the tree belongs to.
+        """
+        self.unique_id = unique_id
+        self.model = model
+        self.pos = None
+        self.columns = columns
+
+    def __eq__(self, other):
+        return isinstance(other, Tree) and other.columns is self.columns and other.unique_id == self.unique_id
+
+    def __hash__(self):
+        return hash(self.unique_id)
+
+    # Shapely Point of the tree, created when it is needed
+    location = property(lambda self: Point(self.lon, self.lat))
+    lon = _column("lon")
+    lat = _column("lat")
+    easting = _column("easting")
+    northing = _column("northing")
+    on_fire = _column("on_fire")
+    is_burned = _column("is_burned")
+    time_lasting_on_fire = _column("time_lasting_on_fire")
+    time_left_on_fire = _column("time_left_on_fire")
+    current_time_to_fire = _column("current_time_to_fire")
+    current_time_on_fire = _column("current_time_on_fire")
+    step_count = _column("step_count")
+    burning_value = _column("burning_value")
+
+    @property
+    def color(self):
+        return str(COLORS[self.columns.color[self.unique_id]])
+
+    @color.setter
+    def color(self, color):
+        self.columns.color[self.unique_id] = COLOR_CODES[color]
+
+    @staticmethod
+    def influence_radius(wind_strength, negligible_intensity=NEGLIGIBLE_INTENSITY, humidity=50, temperature=20):
+        """
+        Distance beyond which a burning tree adds less than `negligible_intensity` to a neighbour.
+
+        :param wind_strength: Wind speed used in the heat intensity.
+        :param negligible_intensity: Intensity below which a contribution is dropped.
+        :param humidity: Relative humidity in percent.
+        :param temperature: Temperature in degrees Celsius.
+        :return: Cut-off radius in meters.
+        """
+        max_intensity = weather_factor(wind_strength, humidity, temperature)
+        if max_intensity <= negligible_intensity:
+            return 0
+
+        return DISTANCE_DECAY * math.log(max_intensity / negligible_intensity)
 
     def step(self):
 
+        instrumentation = self.model.instrumentation
         self.step_count = self.model.step_count
 
         if self.is_burned:
@@ -81,33 +262,44 @@ class Tree(Agent):
             else:
                 self.color = "red"
 
-            print(f"{self.unique_id} burning at time {self.model.step_count}")
+            with instrumentation.phase("events"):
+                self.model.events.record(self.model.step_count, self.unique_id, BURNING)
 
             if self.current_time_on_fire >= self.time_lasting_on_fire:
                 self.on_fire = False
                 self.is_burned = True
                 self.color = "black"
-                print(f"{self.unique_id} burned {self.model.step_count}")
+                with instrumentation.phase("events"):
+                    self.model.events.record(self.model.step_count, self.unique_id, BURNED_OUT)
 
         else:
-            # get a list of all the trees on fire within a range 0.5
-            intensity = [self.calculate_heat_intensity(source=self.location,
-                                                       target=this_tree.location,
-                                                       wind_strength=self.model.wind_conditions["speed"],
-                                                       wind_direction=self.model.wind_conditions["direction"])
-                         for this_tree in self.model.schedule.agents if (this_tree.on_fire and
-                                                                         this_tree.current_time_on_fire > 0)]
-
-            if sum(intensity) < 30:
+            # get a list of all the trees on fire within the influence radius
+            with instrumentation.phase("sources"):
+                sources = self.model.get_burning_source_ids(self.location)
+            with instrumentation.phase("distances"):
+                distance, angle_to_target = self.model.get_distances(self, sources)
+            with instrumentation.phase("intensity"):
+                intensity = heat_intensity(distance=distance,
+                                           angle_to_target=angle_to_target,
+                                           wind_strength=self.model.wind_conditions["speed"],
+                                           wind_direction=self.model.wind_conditions["direction"],
+                                           humidity=self.model.humidity,
+                                           temperature=self.model.temperature)
+            instrumentation.count("intensity_evaluations", len(sources))
+
+            intensity = intensity.sum()
+            if intensity < IGNITION_INTENSITY:
                 probability = 0
-            elif sum(intensity) < 12000:
-                probability = 0.8 * sum(intensity)/12000
+            elif intensity < 12000:
+                probability = 0.8 * intensity/12000
             else:
                 probability = 0.9
 
-            self.on_fire = (random.random() < probability)
+            with instrumentation.phase("rng"):
+                self.on_fire = (self.random.random() < probability)
 
             if self.on_fire:
-                print(f"{self.unique_id} set on fire at time {self.model.step_count}")
+                with instrumentation.phase("events"):
+                    self.model.events.record(self.model.step_count, self.unique_id, IGNITED)
 
 
@@ -0,0 +1,271 @@
+import numpy as np
+import shapely
+from concurrent.futures import ThreadPoolExecutor
+from shapely import STRtree
+from src.distance_kernels import DISTANCE_KERNELS, PROJECTED_KERNELS
+from src.events import EventLog, IGNITED, BURNING, BURNED_OUT
+from src.instrumentation import NoInstrumentation
+from src.spatial_index import radius_in_degrees
+from src.tree_model import heat_intensity, ignition_probability, GREEN, ORANGE, RED, BLACK
+
+# Trees are updated in fixed blocks: a block is the unit of work of a worker and of the random streams
+BLOCK_SIZE = 16384
+
+# Names of the state arrays
+STATE_KEYS = ("on_fire", "is_burned", "current_time_on_fire", "burning_value", "color")
+
+
+class VectorizedEngine:
+
+    def __init__(self, unique_ids, lon, lat, easting, northing, rng, distance_kernel="planar", workers=1,
+                 time_lasting_on_fire=5):
+        """
+        Fire spread engine that keeps the state of every tree in NumPy arrays and updates all of them
+        with batched array operations, using the same rules as `Tree.step`.
+
+        Every tree reads the state at the start of the step (synchronous update): the new state is
+        written into a second set of arrays that is swapped in at the end of the step. The trees are
+        processed in blocks of BLOCK_SIZE, in parallel threads when `workers > 1`. Each block draws its
+        random numbers from its own stream, keyed by the seed, the step and the block, so the results
+        are the same whatever the number of workers. The heat computed at once for the whole step (the
+        sums of a neighbour graph, the FFTs of the raster engine) is split in fixed chunks of work that
+        the same threads share, summed in chunk order.
+
+        :param unique_ids: Sequence with the id of every tree.
+        :param lon: Longitude of the trees.
+        :param lat: Latitude of the trees.
+        :param easting: Projected x coordinates of the trees in meters.
+        :param northing: Projected y coordinates of the trees in meters.
+        :param rng: NumPy random Generator the seed of the random streams is drawn from.
+        :param distance_kernel: Name of the kernel in DISTANCE_KERNELS used for distances and directions.
+        :param workers: Number of threads that process the blocks and the chunks of the step's heat.
+        :param time_lasting_on_fire: Number of steps a tree burns before it is burned.
+        """
+        self.unique_ids = np.asarray(unique_ids, dtype=np.int64)
+        self.lon = np.asarray(lon, dtype=float)
+        self.lat = np.asarray(lat, dtype=float)
+        self.easting = np.asarray(easting, dtype=float)
+        self.northing = np.asarray(northing, dtype=float)
+        self.seed = int(rng.integers(2 ** 63))
+        self.distance_kernel = distance_kernel
+        self.workers = workers
+        self.time_lasting_on_fire = time_lasting_on_fire
+        self.max_latitude = np.abs(self.lat).max() if len(self.lat) else 0
+
+        # Current state and the buffer the next state is written into
+        self.state = self.new_state(len(self.lon))
+        self.next_state = self.new_state(len(self.lon))
+
+        # Coordinates the distance kernel works on
+        if distance_kernel in PROJECTED_KERNELS:
+            self.kernel_x, self.kernel_y = self.easting, self.northing
+        else:
+            self.kernel_x, self.kernel_y = self.lon, self.lat
+
+        self.executor = ThreadPoolExecutor(max_workers=workers) if workers > 1 else None
+
+        # Optional static NeighbourGraph of the trees, used instead of the spatial queries
+        self.neighbour_graph = None
+
+        # Instrumentation and event sink of the model the engine belongs to
+        self.instrumentation = NoInstrumentation()
+        self.events = EventLog(level="silent")
+
+    @staticmethod
+    def new_state(n):
+        return {"on_fire": np.zeros(n, dtype=bool),
+                "is_burned": np.zeros(n, dtype=bool),
+                "current_time_on_fire": np.zeros(n, dtype=np.int32),
+                "burning_value": np.full(n, 0.01),
+                "color": np.full(n, GREEN, dtype=np.int8)}
+
+    def __len__(self):
+        return len(self.lon)
+
+    @property
+    def on_fire(self):
+        return self.state["on_fire"]
+
+    @property
+    def is_burned(self):
+        return self.state["is_burned"]
+
+    @property
+    def current_time_on_fire(self):
+        return self.state["current_time_on_fire"]
+
+    @property
+    def burning_value(self):
+        return self.state["burning_value"]
+
+    @property
+    def color(self):
+        return self.state["color"]
+
+    def map(self, function, items):
+        """
+        Apply a function to every item, in the worker threads if there are several.
+
+        :param function: Function of one item.
+        :param items: Iterable of items.
+        :return: Iterator over the results, in the order of the items.
+        """
+        if self.executor is None:
+            return map(function, items)
+
+        return self.executor.map(function, items)
+
+    def initialise_fire(self, ignited):
+        """
+        Set trees on fire.
+
+        :param ignited: Boolean array with the trees to set on fire.
+        """
+        self.on_fire[:] |= ignited
+
+    def calculate_intensity(self, targets, sources, source_tree, wind_strength, wind_direction, influence_radius,
+                            humidity=50, temperature=20):
+        """
+        Sum the heat intensity that each target tree gets from the burning sources.
+
+        :param targets: Indices of the trees that can catch fire.
+        :param sources: Indices of the burning trees.
+        :param source_tree: STRtree over the locations of the sources.
+        :param wind_strength: Wind speed.
+        :param wind_direction: Wind direction in degrees.
+        :param influence_radius: Distance in meters beyond which contributions are negligible.
+        :param humidity: Relative humidity in percent.
+        :param temperature: Temperature in degrees Celsius.
+        :return: Array with the total heat intensity of every target.
+        """
+        if len(targets) == 0 or len(sources) == 0:
+            return np.zeros(len(targets))
+
+        target_idx, source_idx = source_tree.query(shapely.points(self.lon[targets], self.lat[targets]),
+                                                   predicate="dwithin",
+                                                   distance=radius_in_degrees(influence_radius, self.max_latitude))
+        tree_idx, source_idx = targets[target_idx], sources[source_idx]
+        self.instrumentation.count("intensity_evaluations", len(tree_idx))
+
+        distance, angle_to_target = DISTANCE_KERNELS[self.distance_kernel](
+            self.kernel_x[tree_idx], self.kernel_y[tree_idx],
+            self.kernel_x[source_idx], self.kernel_y[source_idx])
+
+        return np.bincount(target_idx,
+                           weights=heat_intensity(distance, angle_to_target, wind_strength, wind_direction,
+                                                  humidity, temperature),
+                           minlength=len(targets))
+
+    def step_block(self, start, step_count, sources, source_tree, wind_strength, wind_direction, influence_radius,
+                   humidity=50, temperature=20, intensity=None):
+        """
+        Write the next state of the trees in [start, start + BLOCK_SIZE) from the current state.
+
+        With a neighbour graph `intensity` is the heat intensity every tree gets, already computed for
+        the step, instead of querying `source_tree` for the block.
+        """
+        rows = slice(start, min(start + BLOCK_SIZE, len(self)))
+        current = {key: values[rows] for key, values in self.state.items()}
+        following = {key: values[rows] for key, values in self.next_state.items()}
+        for key in STATE_KEYS:
+            following[key][:] = current[key]
+
+        burned = current["is_burned"]
+        burning = current["on_fire"]
+        unburned = ~burning & ~burned
+
+        # Burned trees
+        following["burning_value"][burned] = 1
+
+        # Burning trees
+        time_on_fire = current["current_time_on_fire"][burning] + 1
+        following["current_time_on_fire"][burning] = time_on_fire
+        following["burning_value"][burning] = 0.1
+        following["color"][burning] = np.where(time_on_fire < 2, ORANGE, RED)
+
+        burned_out = burning & (following["current_time_on_fire"] >= self.time_lasting_on_fire)
+        following["on_fire"][burned_out] = False
+        following["is_burned"][burned_out] = True
+        following["color"][burned_out] = BLACK
+
+        # Unburned trees, one draw per tree as in Tree.step from the block's own stream
+        targets = np.flatnonzero(unburned)
+        if intensity is None:
+            with self.instrumentation.phase("intensity"):
+                intensity = self.calculate_intensity(targets + rows.start, sources, source_tree,
+                                                     wind_strength, wind_direction, influence_radius,
+                                                     humidity, temperature)
+        else:
+            intensity = intensity[rows][targets]
+        with self.instrumentation.phase("rng"):
+            draws = np.random.default_rng([self.seed, step_count, start // BLOCK_SIZE]).random(rows.stop - rows.start)
+        following["on_fire"][targets] = draws[targets] < ignition_probability(intensity)
+
+    def source_fuel(self, sources):
+        """
+        :param sources: Indices of the burning trees.
+        :return: Array with the factor of the heat of every source, one tree each.
+        """
+        return np.ones(len(sources))
+
+    def source_intensity(self, sources, wind_strength, wind_direction, influence_radius, humidity=50, temperature=20):
+        """
+        Heat intensity every tree gets from the burning sources, computed at once for the whole step.
+
+        :return: Array with the intensity of every tree, or None to query the sources block by block.
+        """
+        if self.neighbour_graph is None:
+            return None
+
+        graph = self.neighbour_graph
+        if self.instrumentation.enabled:
+            self.instrumentation.count("intensity_evaluations", int((graph.indptr[sources + 1] -
+                                                                     graph.indptr[sources]).sum()))
+
+        return graph.intensity(sources, wind_strength, wind_direction, humidity, temperature, map_chunks=self.map)
+
+    def step(self, wind_strength, wind_direction, influence_radius, step_count, humidity=50, temperature=20):
+
+        sources = np.flatnonzero(self.on_fire & (self.current_time_on_fire > 0))
+        with self.instrumentation.phase("source_intensity"):
+            intensity = self.source_intensity(sources, wind_strength, wind_direction, influence_radius,
+                                              humidity, temperature)
+        with self.instrumentation.phase("source_index"):
+            source_tree = None
+            if intensity is None:
+                source_tree = STRtree(shapely.points(self.lon[sources], self.lat[sources]))
+
+        starts = range(0, len(self), BLOCK_SIZE)
+        arguments = (step_count, sources, source_tree, wind_strength, wind_direction, influence_radius,
+                     humidity, temperature, intensity)
+        list(self.map(lambda start: self.step_block(start, *arguments), starts))
+
+        self.state, self.next_state = self.next_state, self.state
+        with self.instrumentation.phase("events"):
+            self.record_events(step_count)
+
+    def record_events(self, step_count):
+        """
+        Record the events of the step comparing the new state with the previous one: the same events
+        `Tree.step` records, grouped by event and in tree order whatever the number of workers.
+
+        :param step_count: Step that just ran.
+        """
+        events = self.events
+        previous, current = self.next_state, self.state
+        if events.records(BURNING):
+            events.record_many(step_count, self.unique_ids[previous["on_fire"]], BURNING)
+        if events.records(IGNITED):
+            ignited = current["on_fire"] & ~previous["on_fire"] & ~previous["is_burned"]
+            events.record_many(step_count, self.unique_ids[ignited], IGNITED)
+        if events.records(BURNED_OUT):
+            burned_out = current["is_burned"] & ~previous["is_burned"]
+            events.record_many(step_count, self.unique_ids[burned_out], BURNED_OUT)
+
+    def get_state(self):
+        """
+        Current state arrays of the trees (views, copy them to keep them across steps).
+
+        :return: Dictionary with on_fire, is_burned, current_time_on_fire, burning_value and color arrays.
+        """
+        return dict(self.state)
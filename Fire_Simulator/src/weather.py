@@ -0,0 +1,91 @@
+import numpy as np
+import pandas as pd
+
+# Columns of a weather CSV besides the time column
+WEATHER_COLUMNS = ("wind_speed", "wind_direction", "humidity", "temperature")
+
+
+class WeatherSchedule:
+
+    def __init__(self, hours, wind_speed, wind_direction, humidity, temperature, hours_per_step=1.0):
+        """
+        Time series of weather conditions that drive the simulation, such as an hourly forecast. The
+        conditions of a record hold until the next record (no interpolation).
+
+        :param hours: Array with the time of every record in hours from the start of the simulation.
+        :param wind_speed: Array with the wind speed of every record.
+        :param wind_direction: Array with the wind direction of every record in degrees.
+        :param humidity: Array with the relative humidity of every record in percent.
+        :param temperature: Array with the temperature of every record in degrees Celsius.
+        :param hours_per_step: Simulated hours in one step.
+        """
+        hours = np.asarray(hours, dtype=float)
+        order = np.argsort(hours, kind="stable")
+        self.hours = hours[order]
+        self.wind_speed = np.asarray(wind_speed, dtype=float)[order]
+        self.wind_direction = np.asarray(wind_direction, dtype=float)[order]
+        self.humidity = np.asarray(humidity, dtype=float)[order]
+        self.temperature = np.asarray(temperature, dtype=float)[order]
+        self.hours_per_step = hours_per_step
+
+        if len(self.hours) == 0:
+            raise ValueError("A weather schedule needs at least one record")
+
+    def __len__(self):
+        return len(self.hours)
+
+    @classmethod
+    def from_csv(cls, path, time_column="time", hours_per_step=1.0):
+        """
+        Read a weather schedule from a CSV with a time column and the WEATHER_COLUMNS.
+
+        :param path: Path of the CSV file.
+        :param time_column: Column with the time of every record, either hours from the start of the
+            simulation or timestamps (counted from the first one).
+        :param hours_per_step: Simulated hours in one step.
+        :return: WeatherSchedule.
+        """
+        data = pd.read_csv(path)
+        missing = [column for column in (time_column,) + WEATHER_COLUMNS if column not in data]
+        if missing:
+            raise ValueError(f"Missing weather columns {missing} in {path}")
+
+        time = data[time_column]
+        if pd.api.types.is_numeric_dtype(time):
+            hours = time.to_numpy(dtype=float)
+        else:
+            time = pd.to_datetime(time)
+            hours = ((time - time.min()) / pd.Timedelta(hours=1)).to_numpy(dtype=float)
+
+        return cls(hours=hours, hours_per_step=hours_per_step,
+                   **{column: data[column].to_numpy(dtype=float) for column in WEATHER_COLUMNS})
+
+    def conditions_at(self, hour):
+        """
+        Weather at a given time: the last record at or before it (the first record before the first one).
+
+        :param hour: Hours from the start of the simulation.
+        :return: Dictionary with wind_speed, wind_direction, humidity and temperature.
+        """
+        ii = max(np.searchsorted(self.hours, hour, side="right") - 1, 0)
+        return {"wind_speed": float(self.wind_speed[ii]),
+                "wind_direction": float(self.wind_direction[ii]),
+                "humidity": float(self.humidity[ii]),
+                "temperature": float(self.temperature[ii])}
+
+    def conditions_for_step(self, step_count):
+        """
+        Weather during a step, taken at its start: step 1 runs from hour 0 to `hours_per_step`.
+
+        :param step_count: Step of the simulation.
+        :return: Dictionary with wind_speed, wind_direction, humidity and temperature.
+        """
+        return self.conditions_at((step_count - 1) * self.hours_per_step)
+
+    def all_conditions(self):
+        """
+        Every record of the schedule.
+
+        :return: List of dictionaries with wind_speed, wind_direction, humidity and temperature.
+        """
+        return [self.conditions_at(hour) for hour in self.hours]
@@ -0,0 +1,34 @@
+import os
+import pytest
+from shapely.geometry import box
+from src.forest_model import ForestModel
+
+AREA = box(-1.650, 42.810, -1.640, 42.820)
+FIRE = box(-1.646, 42.814, -1.644, 42.816)
+
+
+def make_model(engine, **kwargs):
+    model = ForestModel(areas=[{"name": "A", "area": AREA, "vegetation": [{"tree": "pine", "tree_density_m": 0.1}]}],
+                        wind_conditions={"speed": 60, "direction": 45}, humidity_conditions={"humidity": 20},
+                        trees_per_agent=100, engine=engine, seed=3, **kwargs)
+    model.initialise_fire([{"name": "F", "area": FIRE}])
+    return model
+
+
+@pytest.mark.parametrize("engine, kwargs", [("agent", {}), ("agent", {"scheduler": "active_front"}),
+                                            ("vectorized", {}), ("raster", {})])
+def test_resumed_run_matches_uninterrupted_run(tmp_path, engine, kwargs):
+    path = str(tmp_path / "checkpoint_{step_count}.npz")
+    full = make_model(engine, **kwargs).run_simulation(12, checkpoint_every=6, checkpoint_path=path)
+
+    resumed = ForestModel.from_checkpoint(path.format(step_count=6)).run_simulation(6)
+
+    assert resumed.equals(full[full["step_count"] >= 6].reset_index(drop=True))
+
+
+def test_checkpoint_path_without_npz_suffix(tmp_path):
+    path = str(tmp_path / "checkpoint_{step_count}")
+    make_model("vectorized").run_simulation(4, checkpoint_every=2, checkpoint_path=path)
+
+    assert sorted(os.listdir(tmp_path)) == ["checkpoint_2", "checkpoint_4"]
+    assert ForestModel.from_checkpoint(path.format(step_count=4)).step_count == 4
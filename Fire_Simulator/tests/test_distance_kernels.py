@@ -0,0 +1,65 @@
+import numpy as np
+import pytest
+from shapely.geometry import Point
+from src.distance_kernels import geodesic, haversine, planar
+from src.projection import local_projection
+from src.tree_model import Tree, DISTANCE_DECAY, angular_influence
+
+CENTER = Point(-1.64323, 42.81852)
+
+
+@pytest.fixture(scope="module")
+def pairs():
+    """
+    Random pairs spread over +-20 km of the centre and separated up to the largest influence radius,
+    the range where exp(-d/50) matters, in projected and lon/lat coordinates.
+    """
+    rng = np.random.default_rng(0)
+    projection = local_projection([CENTER.buffer(0.1)])
+    max_distance = Tree.influence_radius(wind_strength=100)
+
+    n = 100000
+    x1, y1 = rng.uniform(-20000, 20000, n), rng.uniform(-20000, 20000, n)
+    bearing = rng.uniform(0, 2 * np.pi, n)
+    separation = rng.uniform(1, max_distance, n)
+    x2, y2 = x1 + separation * np.cos(bearing), y1 + separation * np.sin(bearing)
+    lon1, lat1 = projection.transform(x1, y1, direction="INVERSE")
+    lon2, lat2 = projection.transform(x2, y2, direction="INVERSE")
+
+    return {"projected": (x1, y1, x2, y2), "lonlat": (lon1, lat1, lon2, lat2)}
+
+
+def kernel_results(pairs, name):
+    if name == "planar":
+        return planar(*pairs["projected"])
+    return haversine(*pairs["lonlat"])
+
+
+@pytest.mark.parametrize("name", ["haversine", "planar"])
+def test_distance_against_geodesic(pairs, name):
+    reference, _ = geodesic(*pairs["lonlat"])
+    distance, _ = kernel_results(pairs, name)
+
+    assert np.abs(distance - reference).max() < 0.01
+    factor_error = np.abs(np.expm1(-(distance - reference) / DISTANCE_DECAY))
+    assert factor_error.max() < 1e-4
+
+
+@pytest.mark.parametrize("name", ["haversine", "planar"])
+def test_direction_against_geodesic(pairs, name):
+    _, reference = geodesic(*pairs["lonlat"])
+    _, angle = kernel_results(pairs, name)
+
+    # Difference of the directions wrapped to [-180, 180)
+    assert np.abs(np.mod(angle - reference + 180, 360) - 180).max() < 0.25
+    for wind_direction in (0, 45, 90, 200):
+        influence_error = np.abs(angular_influence(angle, wind_direction) -
+                                 angular_influence(reference, wind_direction))
+        assert influence_error.max() < 5e-3
+
+
+def test_directions_are_counterclockwise_from_east():
+    lon, lat = CENTER.x, CENTER.y
+    for d_lon, d_lat, expected in [(0.01, 0, 0), (0, 0.01, 90), (-0.01, 0, 180), (0, -0.01, -90)]:
+        _, angle = geodesic(lon, lat, lon + d_lon, lat + d_lat)
+        assert np.mod(angle - expected + 180, 360) - 180 == pytest.approx(0, abs=0.1)
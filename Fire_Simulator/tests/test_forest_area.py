@@ -0,0 +1,24 @@
+import numpy as np
+import pytest
+import shapely
+from shapely.geometry import Polygon
+from src.forest_area_model import ForestArea
+
+# U-shaped area: a third of its bounding box, the notch between the arms, is outside
+CONCAVE = Polygon([(-1.650, 42.810), (-1.640, 42.810), (-1.640, 42.820), (-1.643, 42.820), (-1.643, 42.813),
+                   (-1.647, 42.813), (-1.647, 42.820), (-1.650, 42.820)])
+
+
+@pytest.mark.parametrize("n", [1, 17, 5000])
+def test_random_locations_are_inside_the_polygon(n):
+    lon, lat = ForestArea.set_random_agent_location(CONCAVE, n, rng=np.random.default_rng(0))
+
+    assert len(lon) == len(lat) == n
+    assert shapely.contains_xy(CONCAVE, lon, lat).all()
+
+
+def test_random_locations_are_uniform():
+    lon, lat = ForestArea.set_random_agent_location(CONCAVE, 20000, rng=np.random.default_rng(0))
+    in_arm = (lon < -1.647) & (lat > 42.813)
+
+    np.testing.assert_allclose(in_arm.mean(), 0.003 * 0.007 / CONCAVE.area, atol=0.01)
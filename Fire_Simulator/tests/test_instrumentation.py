@@ -0,0 +1,35 @@
+import sys
+import tracemalloc
+import pytest
+from shapely.geometry import box
+from src.forest_model import ForestModel
+from src.instrumentation import Instrumentation
+
+
+def make_model(engine, instrumentation):
+    model = ForestModel(areas=[{"name": "A", "area": box(-1.650, 42.810, -1.640, 42.820),
+                                "vegetation": [{"tree": "pine", "tree_density_m": 0.1}]}],
+                        wind_conditions={"speed": 60, "direction": 45}, humidity_conditions={"humidity": 20},
+                        trees_per_agent=100, engine=engine, seed=3, instrumentation=instrumentation)
+    model.initialise_fire([{"name": "F", "area": box(-1.646, 42.814, -1.644, 42.816)}])
+    return model
+
+
+@pytest.mark.parametrize("engine", ["agent", "vectorized", "raster"])
+def test_capture_stops_when_the_run_ends_first(engine):
+    instrumentation = Instrumentation(profile_steps=(2, 50), trace_memory=True)
+    make_model(engine, instrumentation).run_simulation(10)
+
+    assert instrumentation.profile is not None
+    assert instrumentation.memory_snapshot is not None
+    assert not tracemalloc.is_tracing()
+    assert sys.getprofile() is None
+
+
+@pytest.mark.parametrize("engine", ["agent", "vectorized", "raster"])
+def test_active_counter(engine):
+    instrumentation = Instrumentation()
+    model = make_model(engine, instrumentation)
+    model.run_simulation(3)
+
+    assert (instrumentation.to_frame()["active"] > 0).all()
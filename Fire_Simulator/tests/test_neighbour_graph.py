@@ -0,0 +1,54 @@
+import numpy as np
+import pytest
+import shapely
+from shapely import STRtree
+from shapely.geometry import box
+from src.distance_kernels import DISTANCE_KERNELS
+from src.forest_model import ForestModel
+from src.neighbour_graph import NeighbourGraph
+from src.spatial_index import radius_in_degrees
+from src.tree_model import heat_intensity
+
+AREA = box(-1.650, 42.810, -1.640, 42.820)
+
+
+def make_model(**kwargs):
+    return ForestModel(areas=[{"name": "A", "area": AREA, "vegetation": [{"tree": "pine", "tree_density_m": 0.1}]}],
+                       wind_conditions={"speed": 30, "direction": 45}, humidity_conditions={}, trees_per_agent=100,
+                       engine="vectorized", neighbour_graph=True, seed=3, **kwargs)
+
+
+def test_intensity_matches_pairwise_sum():
+    model = make_model()
+    engine = model.vectorized_engine
+    graph = model.get_neighbour_graph()
+    sources = np.arange(0, len(engine), 7)
+
+    # Brute force sum over every source within the radius of every tree
+    tree = STRtree(shapely.points(engine.lon[sources], engine.lat[sources]))
+    tree_idx, source_idx = tree.query(shapely.points(engine.lon, engine.lat), predicate="dwithin",
+                                      distance=radius_in_degrees(graph.radius, np.abs(engine.lat).max()))
+    source_idx = sources[source_idx]
+    distance, angle_to_target = DISTANCE_KERNELS[model.distance_kernel](
+        engine.kernel_x[tree_idx], engine.kernel_y[tree_idx], engine.kernel_x[source_idx], engine.kernel_y[source_idx])
+    keep = (tree_idx != source_idx) & (distance <= graph.radius)
+    expected = np.bincount(tree_idx[keep], weights=heat_intensity(distance[keep], angle_to_target[keep], 30, 45),
+                           minlength=len(engine))
+
+    # The wind direction is given twice to also check the cached weights of every edge
+    for _ in range(2):
+        np.testing.assert_allclose(graph.intensity(sources, 30, 45), expected, rtol=1e-5, atol=1e-6)
+
+
+def test_graph_over_budget_raises():
+    with pytest.raises(MemoryError, match="neighbour graph"):
+        make_model(graph_max_bytes=1000).get_neighbour_graph()
+
+
+def test_estimate_bounds_the_edge_count():
+    model = make_model()
+    graph = model.get_neighbour_graph()
+    estimate = NeighbourGraph.estimate_edges([len(area.lon) for area in model.areas],
+                                             [area.area_in_square_meters for area in model.areas], graph.radius)
+
+    assert 0.5 * estimate <= graph.n_edges <= estimate
@@ -0,0 +1,46 @@
+import json
+import os
+import subprocess
+import sys
+from src import scenario_cache
+from src.scenario_cache import ScenarioCache, scenario_key
+
+# Claims the lock of a scenario, prints whether it got it and keeps running until its input is closed
+CLAIM = """
+import sys
+from src.scenario_cache import ScenarioCache
+print(ScenarioCache(sys.argv[1]).claim("key", 10), flush=True)
+sys.stdin.read()
+"""
+
+
+def dead_pid():
+    process = subprocess.Popen([sys.executable, "-c", ""])
+    process.wait()
+    return process.pid
+
+
+def test_stale_lock_is_taken_over_once(tmp_path):
+    cache = ScenarioCache(str(tmp_path))
+    with open(cache.lock_path("key"), "w") as file:
+        json.dump({"pid": dead_pid(), "n_steps": 3}, file)
+
+    processes = [subprocess.Popen([sys.executable, "-c", CLAIM, str(tmp_path)], stdin=subprocess.PIPE,
+                                  stdout=subprocess.PIPE, text=True, cwd=os.getcwd(),
+                                  env={**os.environ, "PYTHONPATH": os.getcwd()})
+                 for _ in range(6)]
+    claimed = [process.stdout.readline().strip() == "True" for process in processes]
+    owner = cache.lock_owner("key")
+    for process in processes:
+        process.communicate("")
+
+    assert sum(claimed) == 1
+    assert owner == {"pid": processes[claimed.index(True)].pid, "n_steps": 10}
+    assert sorted(os.listdir(tmp_path)) == ["key.lock"]
+
+
+def test_scenario_key_depends_on_the_version(monkeypatch):
+    key = scenario_key({"trees_per_agent": 100}, [], 10, seed=1)
+    monkeypatch.setattr(scenario_cache, "SCENARIO_VERSION", scenario_cache.SCENARIO_VERSION + 1)
+
+    assert scenario_key({"trees_per_agent": 100}, [], 10, seed=1) != key
@@ -0,0 +1,17 @@
+import pytest
+from shapely.geometry import box
+from src.forest_model import ForestModel
+
+
+def run(**kwargs):
+    model = ForestModel(areas=[{"name": "A", "area": box(-1.650, 42.810, -1.640, 42.820),
+                                "vegetation": [{"tree": "pine", "tree_density_m": 0.1}]}],
+                        wind_conditions={"speed": 60, "direction": 45}, humidity_conditions={"humidity": 20},
+                        trees_per_agent=100, seed=3, **kwargs)
+    model.initialise_fire([{"name": "F", "area": box(-1.646, 42.814, -1.644, 42.816)}])
+    return model.run_simulation(10)
+
+
+@pytest.mark.parametrize("kwargs", [{}, {"update": "synchronous"}, {"scheduler": "active_front"}])
+def test_spatial_index_does_not_change_the_frames(kwargs):
+    assert run(spatial_index=False, **kwargs).equals(run(**kwargs))
@@ -0,0 +1,25 @@
+import pytest
+from shapely.geometry import box
+from src.forest_model import ForestModel
+
+
+def run(engine, record):
+    model = ForestModel(areas=[{"name": "A", "area": box(-1.650, 42.810, -1.640, 42.820),
+                                "vegetation": [{"tree": "pine", "tree_density_m": 0.1}]}],
+                        wind_conditions={"speed": 60, "direction": 45}, humidity_conditions={"humidity": 20},
+                        trees_per_agent=100, engine=engine, seed=3)
+    model.initialise_fire([{"name": "F", "area": box(-1.646, 42.814, -1.644, 42.816)}])
+    return model.run_simulation(12, record=record)
+
+
+@pytest.mark.parametrize("engine", ["agent", "vectorized", "raster"])
+def test_transitions_replay_the_snapshots(engine):
+    snapshots = run(engine, "snapshots")
+    log = run(engine, "transitions")
+
+    assert 0 < len(log) < len(snapshots)
+    assert log.to_snapshots().equals(snapshots)
+    for step_count in (0, 7, 12):
+        assert log.state_at(step_count).equals(snapshots[snapshots["step_count"] == step_count].reset_index(drop=True))
+    with pytest.raises(ValueError):
+        log.state_at(13)
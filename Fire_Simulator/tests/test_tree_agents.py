@@ -0,0 +1,30 @@
+import pytest
+from shapely.geometry import box
+from src.forest_model import ForestModel
+
+
+@pytest.fixture
+def model():
+    return ForestModel(areas=[{"name": "A", "area": box(-1.650, 42.810, -1.640, 42.820),
+                               "vegetation": [{"tree": "pine", "tree_density_m": 0.1}]}],
+                       wind_conditions={"speed": 30, "direction": 45}, humidity_conditions={}, trees_per_agent=100,
+                       seed=1)
+
+
+def test_trees_are_views_on_the_columns(model):
+    tree = model.tree_agents[3]
+    tree.on_fire = True
+    tree.color = "red"
+
+    assert model.tree_columns.on_fire[3]
+    assert model.tree_agents[3].color == "red"
+    assert model.tree_agents[3] == tree
+    assert model.tree_agents[-1].unique_id == len(model.tree_agents) - 1
+    with pytest.raises(IndexError):
+        model.tree_agents[len(model.tree_agents)]
+
+
+def test_no_mesa_agent_per_tree(model):
+    assert len(model.agents) == 0
+    assert model.schedule.get_agent_count() == len(model.tree_agents) == len(model.lon)
+    assert [agent.unique_id for agent in model.schedule.agents] == model.schedule.order.tolist()
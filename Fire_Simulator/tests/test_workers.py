@@ -0,0 +1,25 @@
+import pytest
+from shapely.geometry import box
+from src import neighbour_graph, raster_engine, vectorized_engine
+from src.forest_model import ForestModel
+
+
+def run(workers, **kwargs):
+    model = ForestModel(areas=[{"name": "A", "area": box(-1.650, 42.810, -1.640, 42.820),
+                                "vegetation": [{"tree": "pine", "tree_density_m": 0.1}]}],
+                        wind_conditions={"speed": 60, "direction": 45}, humidity_conditions={"humidity": 20},
+                        trees_per_agent=100, seed=3, workers=workers, **kwargs)
+    model.initialise_fire([{"name": "F", "area": box(-1.646, 42.814, -1.644, 42.816)}])
+    return model.run_simulation(8)
+
+
+@pytest.mark.parametrize("kwargs", [{"engine": "vectorized"},
+                                    {"engine": "vectorized", "neighbour_graph": True},
+                                    {"engine": "raster"}])
+def test_frames_do_not_depend_on_workers(kwargs, monkeypatch):
+    # Small units of work, so that every worker gets several blocks, edge chunks and FFT lines
+    monkeypatch.setattr(vectorized_engine, "BLOCK_SIZE", 64)
+    monkeypatch.setattr(neighbour_graph, "EDGE_BLOCK_SIZE", 1000)
+    monkeypatch.setattr(raster_engine, "FFT_BLOCK_SIZE", 4)
+
+    assert run(1, **kwargs).equals(run(4, **kwargs))